@@ -0,0 +1,428 @@
+############################################################
+# Imports
+############################################################
+import argparse
+import cProfile
+import gc
+import json
+import os
+from os.path import abspath, dirname, join
+import platform
+import pstats
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = dirname(dirname(abspath(__file__)))
+for project in ("SudokuGame", "PartOfSpeech", "SpamFiltering", "TextualPuzzle"):
+    sys.path.insert(0, join(ROOT, project))
+
+from SpamServer import percentiles
+
+
+############################################################
+# Section 1: Synthetic inputs
+############################################################
+
+# everything the benchmarks run on is generated from a seed, so a run needs no data files and two runs at
+# the same scale and seed measure the same work. scale multiplies the sizes below.
+SCALES = {"small": 1, "medium": 4, "large": 16}
+
+def make_puzzles(count, box_size=3, givens=None, seed=0):
+    # one-line puzzles with a single solution each: a shuffled solved grid with cells blanked in random
+    # order as long as the puzzle stays unique (checked with Sudoku.count_solutions), down to givens cells
+    from Sudoku import Sudoku, board_from_string, SYMBOLS
+    rng = random.Random(seed)
+    size = box_size * box_size
+    if givens is None:
+        givens = size * size * 3 // 10
+    puzzles = []
+    for _ in range(count):
+        bands = rng.sample(range(box_size), box_size)
+        rows = [band * box_size + r for band in bands for r in rng.sample(range(box_size), box_size)]
+        stacks = rng.sample(range(box_size), box_size)
+        columns = [stack * box_size + c for stack in stacks for c in rng.sample(range(box_size), box_size)]
+        values = rng.sample(SYMBOLS[:size], size)
+        cells = [values[(box_size * (r % box_size) + r // box_size + c) % size] for r in rows for c in columns]
+        left = len(cells)
+        for i in rng.sample(range(len(cells)), len(cells)):
+            if left <= givens:
+                break
+            kept, cells[i] = cells[i], "."
+            if Sudoku(board_from_string("".join(cells))).count_solutions(2) == 1:
+                left -= 1
+            else:
+                cells[i] = kept
+        puzzles.append("".join(cells))
+    return puzzles
+
+# every tag the Tagger knows: a tag missing from training would leave the model without it
+TAGS = ("NOUN", "VERB", "ADJ", "ADV", "PRON", "DET", "ADP", "NUM", "CONJ", "PRT", "X", ".")
+
+def make_corpus(path, sentences, vocabulary=2000, seed=0, sample_seed=None, shared_share=0.4):
+    # sentences of word=TAG tokens, one per line (the format load_corpus reads), drawn from a random
+    # first-order HMM: each tag has its own Zipf-distributed words, a sample of a pool of words that several
+    # tags share (shared_share of its emissions), and a random distribution of next tags, so words alone do
+    # not give the tags away. "." ends every sentence and may also come up inside one. seed picks the HMM
+    # and sample_seed (default: seed) the sentences, so held-out data comes from the same HMM as training.
+    rng = random.Random(seed)
+    per_tag = max(1, vocabulary // (2 * len(TAGS)))
+    shared = ["w%d" % k for k in range(max(2, vocabulary - per_tag * len(TAGS)))]
+    emissions = {}
+    for tag in TAGS:
+        own = ["%s%d" % (tag.lower(), k) if tag != "." else "." * (k % 3 + 1) for k in range(per_tag)]
+        pool = rng.sample(shared, max(1, len(shared) // 4)) if tag != "." else []
+        zipf = [1.0 / (k + 1) for k in range(per_tag)]
+        own_share = 1 - shared_share if pool else 1.0
+        weights = [own_share * z / sum(zipf) for z in zipf] + [shared_share / max(1, len(pool))] * len(pool)
+        emissions[tag] = (own + pool, weights)
+    following = dict((tag, [rng.random() ** 2 for _ in TAGS]) for tag in TAGS)
+    rng = random.Random(seed if sample_seed is None else sample_seed)
+    with open(path, "w") as file:
+        for _ in range(sentences):
+            tag = rng.choice(TAGS[:-1])
+            tokens = []
+            for _ in range(rng.randint(4, 24)):
+                words, weights = emissions[tag]
+                tokens.append("%s=%s" % (rng.choices(words, weights)[0], tag))
+                tag = rng.choices(TAGS, following[tag])[0]
+            tokens.append(".=.")
+            file.write(" ".join(tokens) + "\n")
+    return path
+
+def make_mail(directory, messages, spam_share=0.4, vocabulary=3000, seed=0):
+    # spam/ and ham/ directories of RFC822 messages whose bodies draw from overlapping word lists, so
+    # the filter has both telling and neutral tokens to learn; returns (spam_dir, ham_dir)
+    rng = random.Random(seed)
+    common = ["w%d" % k for k in range(vocabulary)]
+    slanted = {"spam": ["offer%d" % k for k in range(vocabulary // 10)],
+               "ham": ["meeting%d" % k for k in range(vocabulary // 10)]}
+    zipf = [1.0 / (k + 1) for k in range(vocabulary)]
+    paths = {}
+    for label in ("spam", "ham"):
+        paths[label] = join(directory, label)
+        os.makedirs(paths[label], exist_ok=True)
+    for n in range(messages):
+        label = "spam" if rng.random() < spam_share else "ham"
+        lines = []
+        for _ in range(rng.randint(3, 40)):
+            line = rng.choices(common, zipf, k=rng.randint(3, 14))
+            line += rng.sample(slanted[label], rng.randint(0, 3))
+            rng.shuffle(line)
+            lines.append(" ".join(line))
+        with open(join(paths[label], "%06d.eml" % n), "w") as file:
+            file.write("From: sender%d@example.com\nTo: user@example.com\nSubject: %s\n\n%s\n"
+                       % (rng.randrange(500), " ".join(rng.sample(common[:200], 4)), "\n".join(lines)))
+    return paths["spam"], paths["ham"]
+
+def make_kb(atoms, clauses, queries, width=3, seed=0):
+    # (facts, queries): random width-CNF facts over atoms atoms, written as Or expressions, some wrapped in
+    # an Implies, and distinct random goals of one to three literals, Ors, Ands and Iffs
+    from textualPuzzle import And, Atom, Iff, Implies, Not, Or
+    rng = random.Random(seed)
+    names = [Atom("a%d" % k) for k in range(atoms)]
+    literal = lambda: rng.choice(names) if rng.random() < 0.5 else Not(rng.choice(names))
+    facts = []
+    for _ in range(clauses):
+        chosen = [literal() for _ in range(width)]
+        if rng.random() < 0.2:
+            facts.append(Implies(Not(chosen[0]), Or(*chosen[1:])))
+        else:
+            facts.append(Or(*chosen))
+    goals = []
+    seen = set()
+    while len(goals) < queries and len(seen) < 20 * queries:
+        kind = rng.randrange(4)
+        if kind == 0:
+            goal = literal()
+        elif kind == 1:
+            goal = Or(*[literal() for _ in range(rng.randint(2, 3))])
+        elif kind == 2:
+            goal = And(literal(), literal())
+        else:
+            goal = Iff(literal(), literal())
+        if goal not in seen:
+            seen.add(goal)
+            goals.append(goal)
+    return facts, goals
+
+
+############################################################
+# Section 2: Measurement
+############################################################
+
+class Profiler(object):
+    # optional capture around a measured hot path: a cProfile of the timed pass, written as <name>.prof
+    # with the top functions printed, and/or the biggest tracemalloc allocation sites of the memory pass,
+    # written as <name>.alloc.txt. a Profiler with neither directory records nothing.
+
+    def __init__(self, profile_dir=None, trace_dir=None, top=15):
+        self.profile_dir = profile_dir
+        self.trace_dir = trace_dir
+        self.top = top
+        for directory in (profile_dir, trace_dir):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def file_name(self, name):
+        return name.replace("/", "_").replace(".", "_")
+
+    def start_profile(self):
+        if not self.profile_dir:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop_profile(self, profile, name):
+        if profile is None:
+            return
+        profile.disable()
+        path = join(self.profile_dir, self.file_name(name) + ".prof")
+        profile.dump_stats(path)
+        print("cProfile of %s, %s:" % (name, path), file=sys.stderr)
+        pstats.Stats(profile, stream=sys.stderr).sort_stats("cumulative").print_stats(self.top)
+
+    def save_snapshot(self, name):
+        if not self.trace_dir:
+            return
+        path = join(self.trace_dir, self.file_name(name) + ".alloc.txt")
+        with open(path, "w") as file:
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:self.top]:
+                file.write("%s\n" % stat)
+
+def measure(name, function, inputs, setup=None, profiler=None, memory=True, repeats=5, warmup=1):
+    # runs function(setup(x)) for every x in inputs, repeats times over, and reports calls per second,
+    # p50/p99 latency and the peak memory one call allocated on top of what it started with. setup is not
+    # timed, and every repeat sets its inputs up afresh so a call never sees one an earlier call changed.
+    # the first warmup inputs are run once untimed beforehand, so first-call costs (imports, cold caches)
+    # do not land in the tail. the timed passes run without tracemalloc, which slows Python down
+    # severalfold; peak memory comes from one more pass under it.
+    setup = setup or (lambda x: x)
+    profiler = profiler or Profiler()
+    inputs = list(inputs)
+    for x in inputs[:warmup]:
+        function(setup(x))
+    latencies = []
+    profile = profiler.start_profile()
+    for _ in range(repeats):
+        if profile is not None:
+            profile.disable()
+        prepared = [setup(x) for x in inputs]
+        gc.collect()
+        if profile is not None:
+            profile.enable()
+        for argument in prepared:
+            started = time.perf_counter()
+            function(argument)
+            latencies.append(time.perf_counter() - started)
+    profiler.stop_profile(profile, name)
+    seconds = sum(latencies)
+    result = {"calls": len(latencies), "seconds": seconds, "per_second": len(latencies) / seconds if seconds else None}
+    result.update(percentiles(latencies))
+
+    if memory:
+        prepared = [setup(x) for x in inputs]
+        peak = 0
+        tracemalloc.start()
+        try:
+            for argument in prepared:
+                tracemalloc.reset_peak()
+                current = tracemalloc.get_traced_memory()[0]
+                function(argument)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+            profiler.save_snapshot(name)
+        finally:
+            tracemalloc.stop()
+        result["peak_kb"] = peak / 1024.0
+    return result
+
+
+############################################################
+# Section 3: Benchmarks
+############################################################
+
+# each benchmark takes (scale, seed, profiler, workdir) and returns {name: measurement}; names are
+# "<project>.<hot path>", which is what baselines are matched on
+
+def bench_sudoku(scale, seed, profiler, workdir):
+    from Sudoku import Sudoku, board_from_string
+    puzzles = make_puzzles(10 * scale, seed=seed)
+    large = make_puzzles(max(1, scale // 4), box_size=4, seed=seed)
+    new = lambda puzzle: Sudoku(board_from_string(puzzle))
+    results = {}
+    for method in ("infer_ac3", "infer_improved", "infer_propagate", "infer_with_guessing", "infer_exact_cover"):
+        results["sudoku." + method] = measure("sudoku." + method, lambda s, m=method: getattr(s, m)(),
+                                             puzzles, new, profiler)
+    for method in ("infer_with_guessing", "infer_exact_cover"):
+        results["sudoku16." + method] = measure("sudoku16." + method, lambda s, m=method: getattr(s, m)(),
+                                               large, new, profiler)
+    return results
+
+def bench_tagger(scale, seed, profiler, workdir):
+    from POS_Tagging_Markov import Tagger, load_corpus, sentence_words
+    path = make_corpus(join(workdir, "corpus.txt"), 2000 * scale, vocabulary=1000 * scale, seed=seed)
+    held_out = make_corpus(join(workdir, "held_out.txt"), 200 * scale, vocabulary=1000 * scale, seed=seed,
+                           sample_seed=seed + 1)
+    training = load_corpus(path)
+    gold = load_corpus(held_out)
+    sentences = [sentence_words(sentence) for sentence in gold]
+    results = {"tagger.__init__": measure("tagger.__init__", Tagger, [training], profiler=profiler)}
+    tagger = Tagger(training)
+    for method in ("most_probable_tags", "viterbi_tags"):
+        function = getattr(tagger, method)
+        result = results["tagger." + method] = measure("tagger." + method, function, sentences, profiler=profiler)
+        tags = [tag for sentence in sentences for tag in function(sentence)]
+        answers = [tag for sentence in gold for (word, tag) in sentence]
+        result["accuracy"] = sum(tag == answer for tag, answer in zip(tags, answers)) / float(len(answers))
+    return results
+
+def bench_spam(scale, seed, profiler, workdir):
+    from FilterSpamEmail import SpamFilter
+    spam_dir, ham_dir = make_mail(join(workdir, "train"), 500 * scale, seed=seed)
+    test_dirs = make_mail(join(workdir, "test"), 200 * scale, seed=seed + 1)
+    test = [join(directory, f) for directory in test_dirs for f in sorted(os.listdir(directory))]
+    train = lambda smoothing: SpamFilter(spam_dir, ham_dir, smoothing)
+    results = {"spam.__init__": measure("spam.__init__", train, [1e-5] * 3, profiler=profiler)}
+    spam_filter = train(1e-5)
+    result = results["spam.is_spam"] = measure("spam.is_spam", spam_filter.is_spam, test, profiler=profiler)
+    result["accuracy"] = sum(spam_filter.is_spam(path) == path.startswith(test_dirs[0]) for path in test) / float(len(test))
+    return results
+
+def bench_kb(scale, seed, profiler, workdir):
+    from textualPuzzle import KnowledgeBase
+    results = {}
+    for tseitin in (False, True):
+        name = "kb.ask" + (".tseitin" if tseitin else "")
+        facts, goals = make_kb(40 * scale, 120 * scale, 50 * scale, seed=seed)
+        def setup(goal):
+            # every goal is asked of a kb that has just been told the facts, so no answer is cached
+            kb = KnowledgeBase(tseitin=tseitin)
+            for fact in facts:
+                kb.tell(fact)
+            return kb, goal
+        results[name] = measure(name, lambda argument: argument[0].ask(argument[1]), goals, setup, profiler)
+        kb = KnowledgeBase(tseitin=tseitin)
+        for fact in facts:
+            kb.tell(fact)
+        # the same goals against one long-lived kb, where learned clauses carry over between queries
+        # (once and without a warm-up: a second ask of a goal is a cache hit)
+        results[name + ".shared"] = measure(name + ".shared", kb.ask, goals, profiler=profiler, memory=False,
+                                            repeats=1, warmup=0)
+    return results
+
+BENCHMARKS = {"sudoku": bench_sudoku, "tagger": bench_tagger, "spam": bench_spam, "kb": bench_kb}
+
+
+############################################################
+# Section 4: Results and baselines
+############################################################
+
+# a measurement regresses when its throughput falls, or its p99 latency or peak memory grows, by more than
+# the tolerance (a fraction) relative to the baseline, or when its accuracy, for the benchmarks that have
+# answers to check against, falls by more than accuracy_tolerance (absolute): a faster model that gets the
+# answers wrong is not a speedup. timings of very short runs are noisy, so latencies under min_ms are not
+# compared, and neither is the p99 of a run with fewer than min_samples calls on either side: below that
+# the nearest-rank p99 is one of the few slowest calls, which says more about the machine than the code.
+def compare(results, baseline, tolerance=0.2, min_ms=0.05, accuracy_tolerance=0.01, min_samples=100):
+    regressions = []
+    for name, current in sorted(results["benchmarks"].items()):
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None:
+            continue
+        checks = (("per_second", -1), ("p99_ms", 1), ("peak_kb", 1))
+        for key, direction in checks:
+            old, new = before.get(key), current.get(key)
+            if not old or new is None:
+                continue
+            if key == "p99_ms" and (max(old, new) < min_ms
+                                    or min(before.get("calls", 0), current.get("calls", 0)) < min_samples):
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append({"benchmark": name, "metric": key, "baseline": old, "current": new,
+                                    "change": change})
+        old, new = before.get("accuracy"), current.get("accuracy")
+        if old is not None and new is not None and new < old - accuracy_tolerance:
+            regressions.append({"benchmark": name, "metric": "accuracy", "baseline": old, "current": new,
+                                "change": (new - old) / old})
+    return regressions
+
+def run(names, scale, seed, profiler):
+    results = {"meta": {"scale": scale, "seed": seed, "python": platform.python_version(),
+                        "machine": platform.machine(), "platform": platform.platform(),
+                        "cpus": os.cpu_count(), "started": time.strftime("%Y-%m-%dT%H:%M:%S")},
+               "benchmarks": {}}
+    with tempfile.TemporaryDirectory(prefix="benchmark") as workdir:
+        for name in names:
+            started = time.perf_counter()
+            directory = join(workdir, name)
+            os.makedirs(directory)
+            results["benchmarks"].update(BENCHMARKS[name](scale, seed, profiler, directory))
+            print("%s done in %.1f s" % (name, time.perf_counter() - started), file=sys.stderr)
+    return results
+
+def print_table(results, regressions=()):
+    flagged = set((r["benchmark"], r["metric"]) for r in regressions)
+    print("%-34s %8s %12s %10s %10s %11s %9s" % ("benchmark", "calls", "per second", "p50 ms", "p99 ms", "peak KiB",
+                                                "accuracy"))
+    for name, result in sorted(results["benchmarks"].items()):
+        cells = []
+        for key, width, form in (("per_second", 12, "%.1f"), ("p50_ms", 10, "%.3f"), ("p99_ms", 10, "%.3f"),
+                                 ("peak_kb", 11, "%.1f"), ("accuracy", 9, "%.4f")):
+            cell = "-" if result.get(key) is None else form % result[key]
+            if (name, key) in flagged:
+                cell = "!" + cell
+            cells.append(cell.rjust(width))
+        print("%-34s %8d %s" % (name, result["calls"], " ".join(cells)))
+    for r in regressions:
+        print("REGRESSION %s %s: %.4g -> %.4g (%+.0f%%)" % (r["benchmark"], r["metric"], r["baseline"],
+                                                            r["current"], 100 * r["change"]))
+
+
+############################################################
+# Section 5: Command Line
+############################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmarks of the hot paths of every project, on synthetic inputs")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help="any of %s (default: all)" % ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument("--scale", default="small", help="small, medium, large or a multiplier")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change that counts as a regression")
+    parser.add_argument("--profile", metavar="DIR", help="cProfile every hot path, writing DIR/<name>.prof")
+    parser.add_argument("--trace-malloc", metavar="DIR", help="write the top allocation sites to DIR/<name>.alloc.txt")
+    args = parser.parse_args(argv)
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline, the file to write")
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error("no benchmark named %s" % ", ".join(sorted(unknown)))
+    scale = SCALES[args.scale] if args.scale in SCALES else max(1, int(float(args.scale)))
+
+    results = run(args.benchmarks or sorted(BENCHMARKS), scale, args.seed, Profiler(args.profile, args.trace_malloc))
+    regressions = []
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("meta", {}).get("scale") != scale:
+            print("warning: the baseline was run at scale %s" % baseline.get("meta", {}).get("scale"), file=sys.stderr)
+        if args.profile:
+            print("warning: cProfile slows the timed pass, so the comparison is not meaningful", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        results["regressions"] = regressions
+    print_table(results, regressions)
+    for path in (args.output, args.baseline if args.save_baseline else None):
+        if path:
+            with open(path, "w") as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,17 @@
 # Imports
 ############################################################
 from collections import defaultdict
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import json
+import locale
 import math
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
 
 
 
@@ -12,10 +21,36 @@ import math
 ############################################################
 
 def load_corpus(path):
-    file = open(path)
-    return [[tuple(token.split('=')) for token in line.split()] for line in file]
+    return list(iter_corpus(path))
     pass
 
+def iter_corpus(path):
+    # lazily yields one sentence per line, [('It','PRON'),('made','VERB'),...], keeping only one line in memory
+    with open(path) as file:
+        for line in file:
+            yield [tuple(token.split('=')) for token in line.split()]
+
+def iter_corpus_range(path, start=0, end=None):
+    # the sentences of the lines that start inside bytes [start, end) of the file, so that
+    # consecutive ranges of one file cover every line exactly once
+    encoding = locale.getpreferredencoding(False)
+    with open(path, 'rb') as file:
+        if start > 0:
+            file.seek(start - 1)
+            file.readline()  # finish the line running into the range; it belongs to the range before
+        while end is None or file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            yield [tuple(token.split('=')) for token in line.decode(encoding).split()]
+
+def sentence_words(sentence):
+    # accepts plain tokens or the (word, tag) pairs that load_corpus produces
+    return [token[0] if isinstance(token, tuple) else token for token in sentence]
+
+MODEL_MAGIC = b"HMMTAG01"  # first bytes of a file written by Tagger.save
+START = '<S>'  # tag before the first one of a sentence, for trigram contexts
+
 alpha = 1e-10
 def prob(count_of_w, sum_of_words, num_vocabset_V):
     #probability_done = math.log((count_of_w + alpha) / (sum_of_words + alpha * (num_vocabset_V + 1.0)))
@@ -24,6 +59,83 @@ def prob(count_of_w, sum_of_words, num_vocabset_V):
     return probability_done
 
 
+class TaggerCounts(object):
+    # raw training counts for a Tagger. update() consumes any iterable of sentences one at a time,
+    # so memory grows with the vocabulary rather than with the corpus, and counts taken from
+    # separate shards of a corpus add up with merge(). Tagger.from_counts() turns them into a model.
+
+    def __init__(self):
+        self.sentences = 0                   # number of sentences
+        self.sum_of_Tags = defaultdict(int)  # total count of tags or set of tags
+        self.ini_pi = defaultdict(int)       # pi(ti) : probability that a sentence begins with tag ti
+        self.tran_a = defaultdict(int)       # transition probabilities
+        self.emiss_b = defaultdict(int)      # emission probabilities
+        self.tri_a = defaultdict(int)        # trigram transitions (t_i-2, t_i-1, t_i), t_-1 = START
+
+    def update(self, sentences):
+        # sentence = [('It','PRON'),('made','VERB'),('him','PRON'),('human','NOUN'),('.','.')]
+        sum_of_Tags, ini_pi, tran_a, emiss_b, tri_a = self.sum_of_Tags, self.ini_pi, self.tran_a, self.emiss_b, self.tri_a
+        for sentence in sentences:
+            if not sentence:
+                continue
+            self.sentences += 1
+            ini_pi[sentence[0][1]] += 1 #init count
+            for i in range(len(sentence)):
+                emiss_b[(sentence[i][1], sentence[i][0])] += 1  # ex. emiss_b[('PRON','It')]=1
+                sum_of_Tags[sentence[i][1]] += 1     #tag_count           # ex. {'DET': 137019, 'NOUN' : 275558 ,....}
+                if i < len(sentence)-1:
+                    tran_a[(sentence[i][1], sentence[i + 1][1])] += 1  # ex. {('PRON','VERB'):85838, (....} #tran_count
+                if i > 0:
+                    tri_a[(sentence[i - 2][1] if i > 1 else START, sentence[i - 1][1], sentence[i][1])] += 1
+        return self
+
+    def merge(self, other):
+        # adds the counts of other (e.g. another shard of the corpus) into this one
+        self.sentences += other.sentences
+        for mine, theirs in ((self.sum_of_Tags, other.sum_of_Tags), (self.ini_pi, other.ini_pi),
+                             (self.tran_a, other.tran_a), (self.emiss_b, other.emiss_b), (self.tri_a, other.tri_a)):
+            for key, count in theirs.items():
+                mine[key] += count
+        return self
+
+    def __add__(self, other):
+        return TaggerCounts().merge(self).merge(other)
+
+def count_corpus(path, start=0, end=None):
+    # counts of the sentences in bytes [start, end) of a corpus file
+    return TaggerCounts().update(iter_corpus_range(path, start, end))
+
+def corpus_shards(paths, shards_per_file=1):
+    # splits each corpus file into byte ranges of about equal size for count_corpus
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        step = max(1, -(-size // shards_per_file))
+        shards.extend((path, start, min(start + step, size)) for start in range(0, size, step))
+    return shards
+
+def count_corpus_shards(paths, workers=None, shards_per_file=None):
+    # counts one or more corpus files in a process pool, each file cut into shards_per_file byte
+    # ranges (by default enough to keep every worker busy), and merges the shard counts
+    if isinstance(paths, str):
+        paths = [paths]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if shards_per_file is None:
+        shards_per_file = max(1, -(-workers // len(paths)))
+    shards = corpus_shards(paths, shards_per_file)
+
+    counts = TaggerCounts()
+    if workers <= 1:
+        for shard in shards:
+            counts.merge(count_corpus(*shard))
+        return counts
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for shard_counts in executor.map(count_corpus, *zip(*shards)):
+            counts.merge(shard_counts)
+    return counts
+
+
 class Tagger(object):
     """
     set of tags = {t1,t2, ...., tn}
@@ -35,58 +147,153 @@ class Tagger(object):
 
     def __init__(self, sentences):
         # sentence = [('It','PRON'),('made','VERB'),('him','PRON'),('human','NOUN'),('.','.')]
-        self.tags = ['NOUN', 'VERB', 'ADJ', 'ADV', 'PRON', 'DET', 'ADP', 'NUM', 'CONJ', 'PRT', '.', 'X']
+        # sentences may be any iterable, e.g. iter_corpus(path); it is read once
         self.sentences = sentences
+        self.finalize(TaggerCounts().update(sentences))
+        pass
 
-        sum_of_Tags = defaultdict(int)  # total count of tags or set of tags
-        ini_pi = defaultdict(int)       # pi(ti) : probability that a sentence begins with tag ti
-        tran_a = defaultdict(int)       # transition probabilities
-        emiss_b = defaultdict(int)      # emission probabilities
+    @classmethod
+    def from_counts(cls, counts):
+        # a Tagger from already accumulated (and possibly merged) TaggerCounts
+        tagger = cls.__new__(cls)
+        tagger.sentences = None
+        tagger.finalize(counts)
+        return tagger
 
-        for sentence in self.sentences:
-            ini_pi[sentence[0][1]] += 1 #init count
-            for i in range(len(sentence)):
-                emiss_b[(sentence[i][1], sentence[i][0])] += 1  # ex. emiss_b[('PRON','It')]=1
-                sum_of_Tags[sentence[i][1]] += 1     #tag_count           # ex. {'DET': 137019, 'NOUN' : 275558 ,....}
-                if i < len(sentence)-1:
-                    tran_a[(sentence[i][1], sentence[i + 1][1])] += 1  # ex. {('PRON','VERB'):85838, (....} #tran_count
+    @classmethod
+    def from_corpus(cls, paths, workers=None, shards_per_file=None):
+        # trains on one or more corpus files without loading them, counting shards in parallel
+        return cls.from_counts(count_corpus_shards(paths, workers, shards_per_file))
 
+    def finalize(self, counts, lambdas=None):
+        # turns raw counts into the smoothed probability tables and the compiled model.
+        # lambdas are the (trigram, bigram, unigram) interpolation weights of the trigram model;
+        # by default they are estimated from the counts by deleted interpolation.
+        self.tags = ['NOUN', 'VERB', 'ADJ', 'ADV', 'PRON', 'DET', 'ADP', 'NUM', 'CONJ', 'PRT', '.', 'X']
+        sum_of_Tags, ini_pi, tran_a, emiss_b = counts.sum_of_Tags, counts.ini_pi, counts.tran_a, counts.emiss_b
 
         # 1. initial tag probabilities: sentence begins with tag t
-            # count_of_w = ini_pi[tag], sum_of_words = len(sentences), num_vocab_V = len(ini_pi)
+            # count_of_w = ini_pi[tag], sum_of_words = number of sentences, num_vocab_V = len(ini_pi)
             # self.ini_pi = tag , prob
-        self.ini_pi = dict((tag_t, prob(ini_pi[tag_t], len(sentences), len(ini_pi))) for tag_t in ini_pi)
+        self.ini_pi = dict((tag_t, prob(ini_pi[tag_t], counts.sentences, len(ini_pi))) for tag_t in ini_pi)
         #self.ini_pi['<UNK>'] = prob(0, len(sentences), len(ini_pi))
 
         # 2. transition probabilities:
         self.tran_a = defaultdict(float)
-        a_counter = Counter(list(tran_a))  # vocabulary set
+        a_counter = defaultdict(int)  # vocabulary set: number of distinct tags seen after t_i
+        for (t_i, t_j) in tran_a:
+            a_counter[t_i] += 1
         for (t_i, t_j) in tran_a:
             self.tran_a[(t_i, t_j)] = prob(tran_a[(t_i, t_j)], sum_of_Tags[t_i], a_counter[t_i])
             self.tran_a[('<UNK>', t_j)] = prob(0, sum_of_Tags[t_i], a_counter[t_i])
 
         # 3. emission probabilities:
         self.emiss_b = defaultdict(float)
-        b_counter = Counter(list(emiss_b))  # vocab size
+        b_counter = defaultdict(int)  # vocab size: number of distinct words seen with tag t
+        for (t, w) in emiss_b:
+            b_counter[t] += 1
 
         for (t, w) in emiss_b:
             self.emiss_b[(t, w)] = prob(emiss_b[(t, w)], sum_of_Tags[t], b_counter[t])  # ('DET', 'The'),0.0532
             self.emiss_b[('<UNK>', w)] = prob(0, sum_of_Tags[t], b_counter[t])
 
+        self.tag_counts = dict(sum_of_Tags)
+
+        # smoothed probabilities for events never seen in training. a tag that never occurs gets 0 instead:
+        # prob(0, 0, 0) is 1, which would let it emit every word and follow every tag with certainty
+        unseen_pi = prob(0, counts.sentences, len(ini_pi))
+        unseen_a = dict((t, prob(0, sum_of_Tags[t], a_counter[t]) if sum_of_Tags[t] else 0.0) for t in self.tags)
+        unseen_b = dict((t, prob(0, sum_of_Tags[t], b_counter[t]) if sum_of_Tags[t] else 0.0) for t in self.tags)
+        self.compile(unseen_pi, unseen_a, unseen_b)
+        self.compile_trigrams(counts, lambdas)
         pass
 
+    def compile(self, unseen_pi, unseen_a, unseen_b):
+        # 4. dense log-space model for the decoders:
+            # log_pi[i]       = log pi(tags[i])
+            # log_a[i, j]     = log a(tags[i] --> tags[j])
+            # log_b[i, words[w]] = log b(tags[i] --> w); the last column is for words never seen in training
+            # pairs never seen in training get the smoothed unseen probability instead of 0; the rows of tags
+            # never seen at all are log 0 = -inf, so no path goes through them
+        n = len(self.tags)
+        self.tag_index = dict((tag, i) for i, tag in enumerate(self.tags))
+        seen = np.array([self.tag_counts.get(tag, 0) > 0 for tag in self.tags])
+
+        with np.errstate(divide="ignore"):
+            self.log_pi = np.log(np.array([self.ini_pi.get(tag, unseen_pi) for tag in self.tags]))
+            self.log_pi[~seen] = -np.inf
+            self.log_a = np.log(np.array([[unseen_a[t_i]] * n for t_i in self.tags]))
+        for (t_i, t_j), probability in self.tran_a.items():
+            if t_i in self.tag_index and t_j in self.tag_index:
+                self.log_a[self.tag_index[t_i], self.tag_index[t_j]] = math.log(probability)
+
+        self.words = {}
+        for (t, w) in self.emiss_b:
+            if t in self.tag_index and w not in self.words:
+                self.words[w] = len(self.words)
+        self.unknown_column = len(self.words)
+        self.log_b = np.empty((n, len(self.words) + 1))
+        with np.errstate(divide="ignore"):
+            self.log_b[:] = np.log(np.array([unseen_b[t] for t in self.tags]))[:, None]
+        for (t, w), probability in self.emiss_b.items():
+            if t in self.tag_index:
+                self.log_b[self.tag_index[t], self.words[w]] = math.log(probability)
+
+        # 5. inverted index word -> argmax_t b(t --> w) for most_probable_tags.
+            # first tag wins ties, as max() over emiss_b did; words never seen in training get the most frequent tag
+        best = {}
+        for (t, w), probability in self.emiss_b.items():
+            if t in self.tag_index and (w not in best or probability > best[w][1]):
+                best[w] = (t, probability)
+        self.word_tags = dict((w, t) for w, (t, probability) in best.items())
+        self.unknown_tag = max(self.tags, key=lambda t: self.tag_counts.get(t, 0))
+        pass
+
+    def compile_trigrams(self, counts, lambdas=None):
+        # 6. second-order transitions, log_a3[u, v, w] = log a(u, v --> w) with u = N standing for START:
+            # a(u, v --> w) = l3 * prob(tri(u, v, w)) + l2 * a(v --> w) + l1 * prob(count(w))
+            # the trigram estimate uses prob() with the (u, v) pair count and its number of distinct successors,
+            # and falls back to the bigram estimate for pairs never seen in training
+        n = len(self.tags)
+        index = dict(self.tag_index)
+        index[START] = n
+        pair_total = np.zeros((n + 1, n))
+        pair_types = np.zeros((n + 1, n))
+        trigram = np.zeros((n + 1, n, n))
+        for (u, v, w), count in counts.tri_a.items():
+            if u in index and v in self.tag_index and w in self.tag_index:
+                trigram[index[u], index[v], index[w]] = count
+                pair_total[index[u], index[v]] += count
+                pair_types[index[u], index[v]] += 1
+        unigram = np.array([self.tag_counts.get(t, 0) for t in self.tags], dtype=float)
+
+        if lambdas is None:
+            lambdas = deleted_interpolation(trigram, pair_total, np.exp(self.log_a), counts.tran_a, self.tags, unigram)
+        self.lambdas = tuple(float(l) for l in lambdas)
+
+        p2 = np.broadcast_to(np.exp(self.log_a), (n + 1, n, n))
+        p3 = np.vectorize(prob)(trigram, pair_total[:, :, None], pair_types[:, :, None])
+        p3 = np.where(pair_total[:, :, None] > 0, p3, p2)  # a context never seen in training says nothing
+        p1 = np.array([prob(count, unigram.sum(), n) for count in unigram])
+        l3, l2, l1 = self.lambdas
+        self.log_a3 = np.log(l3 * p3 + l2 * p2 + l1 * p1)
+        pass
+
+    def word_columns(self, tokens):
+        # emission-matrix column of each token, unknown words mapped to the last column
+        words = self.words
+        unknown = self.unknown_column
+        return np.fromiter((words.get(word, unknown) for word in tokens), dtype=np.intp, count=len(tokens))
+
 
 
     def most_probable_tags(self, tokens):
         # Returns the list of the most probable tags corresponding to each input token.
         # argmax b(t --> w) . use emission probabilities
-        checked_dicts = []
-
-        #for word in tokens:  # vocabs = ('DET', 'The') , probability = 0.0532
-        checked_dicts = [dict((vocabs, probability) for vocabs, probability in self.emiss_b.items() if vocabs[1] == word)for word in tokens]
-            #dicts = [dict((vocabs, probability) for vocabs, probability in self.emiss_b.items() if vocabs[1] == token) for token in tokens]
-
-        result = [max(dicts, key=dicts.get)[0] for dicts in checked_dicts]
+        # one lookup per token in the word -> best tag index built at training time
+        word_tags = self.word_tags
+        unknown = self.unknown_tag
+        result = [word_tags.get(word, unknown) for word in tokens]
         return result
         pass
 
@@ -96,27 +303,233 @@ class Tagger(object):
         # stage 1: first compute the probability of the most likely tag sequence
         # stage 2: reconstruct the sequence which achieves that probability from end to beginning by tracing backpointers.
         # initialize, recursion, termination.
-        # CHECK SUDO CODE FROM MT27 PDF!!!!!!!!! & wikipedia
+        # runs on the compiled log-space arrays: sums of logs instead of products, so long sentences
+        # do not underflow, and each time step is a single broadcast over all N x N tag pairs.
+        if not tokens:
+            return []
+        emit = self.log_b[:, self.word_columns(tokens)]  # N x T
+        back = np.empty((len(tokens), len(self.tags)), dtype=np.intp)
+
+        V = self.log_pi + emit[:, 0]  # viterbi[s,1] <- log pi + log bs(o_1)
+        for t in range(1, len(tokens)):  # for each time step t from 2 to T
+            scores = V[:, None] + self.log_a  # scores[i, j]: best path ending in tag i, then moving to tag j
+            back[t] = scores.argmax(axis=0)
+            V = scores.max(axis=0) + emit[:, t]
+
+        # termination step. end to beginning
+        best = int(V.argmax())
+        sequence = [best]
+        for t in range(len(tokens) - 1, 0, -1):
+            best = back[t, best]
+            sequence.append(best)
+
+        return [self.tags[i] for i in reversed(sequence)]
+        pass
+
+
+    def viterbi_tags_batch(self, sentences):
+        # viterbi_tags for many sentences of different lengths at once; results come back in input order.
+        # sentences are sorted longest first, so the ones still running at time step t are always a
+        # prefix of the batch: every step is one broadcast over (running sentences x N x N) with no padding work.
+        sentences = [sentence_words(sentence) for sentence in sentences]
+        results = [[] for sentence in sentences]
+        order = sorted((i for i in range(len(sentences)) if sentences[i]), key=lambda i: -len(sentences[i]))
+        if not order:
+            return results
+
+        lengths = np.array([len(sentences[i]) for i in order])
+        B, T, N = len(order), int(lengths[0]), len(self.tags)
+        columns = np.full((B, T), self.unknown_column, dtype=np.intp)
+        for row, i in enumerate(order):
+            columns[row, :lengths[row]] = self.word_columns(sentences[i])
+        emit = self.log_b.T[columns]  # B x T x N
+        running = np.searchsorted(-lengths, -np.arange(T))  # running[t]: sentences longer than t
+        back = np.empty((T, B, N), dtype=np.intp)
+
+        V = self.log_pi + emit[:, 0]  # B x N
+        for t in range(1, T):
+            k = running[t]
+            scores = V[:k, :, None] + self.log_a  # k x N x N
+            back[t, :k] = scores.argmax(axis=1)
+            V[:k] = scores.max(axis=1) + emit[:k, t]
 
-        V = [{} for i in range(len(tokens))]  # [{}, {}, {}, {}, {}]
-        T = [{} for i in range(len(tokens))]
+        # each row of V now holds the scores at that sentence's last token; walk all paths back together
+        best = V.argmax(axis=1)
+        paths = np.empty((B, T), dtype=np.intp)
+        for t in range(T - 1, -1, -1):
+            k = running[t]
+            paths[:k, t] = best[:k]
+            if t > 0:
+                best[:k] = back[t, np.arange(k), best[:k]]
 
-        for tag in self.tags:  # for each state s from 1 to N
-            V[0][tag] = self.ini_pi[tag] * self.emiss_b[(tag, tokens[0])]  # viterbi[s,1] <- pi * bs(o_1)
+        for row, i in enumerate(order):
+            results[i] = [self.tags[j] for j in paths[row, :lengths[row]]]
+        return results
+
+    def viterbi_tags_stream(self, sentences, batch_size=256):
+        # tags an iterator of sentences (e.g. iter_corpus(path)) batch_size at a time, yielding one tag
+        # list per sentence in order; memory stays bounded by one batch however long the corpus is
+        sentences = iter(sentences)
+        while True:
+            batch = list(islice(sentences, batch_size))
+            if not batch:
+                return
+            for tags in self.viterbi_tags_batch(batch):
+                yield tags
+
+    def viterbi_tags_trigram(self, tokens, beam=None):
+        # Viterbi over the second-order model: a state is the pair (tag at t-1, tag at t). exhaustive search
+        # has N^2 states per token; with beam set, only the beam highest-scoring states survive each step,
+        # which trades a little accuracy for much less work (see beam_tradeoff).
+        if beam is not None and beam < 1:
+            raise ValueError("beam must be at least 1 (or None for exhaustive search), not %r" % (beam,))
+        if not tokens:
+            return []
+        n = len(self.tags)
+        emit = self.log_b[:, self.word_columns(tokens)]  # N x T
+        tags_n = np.arange(n)
+
+        # states at t = 0: (START, w)
+        prev = np.full(n, n)
+        cur = tags_n.copy()
+        score = self.log_pi + emit[:, 0]
+        if beam is not None and beam < n:
+            keep = np.argpartition(-score, beam - 1)[:beam]
+            prev, cur, score = prev[keep], cur[keep], score[keep]
+        tags_at = [cur]
+        parents = [None]
 
         for t in range(1, len(tokens)):  # for each time step t from 2 to T
-            for tag_j in self.tags:  # for each state s from 1 to N
-                temp = []
-                for tag in self.tags:
-                    temp.append((V[t - 1][tag] * self.tran_a[(tag, tag_j)] * self.emiss_b[(tag_j, tokens[t])], tag))
-                (V[t][tag_j], T[t][tag_j]) = max(temp)
+            candidates = score[:, None] + self.log_a3[prev, cur] + emit[:, t]  # states x N
+            keys = (cur[:, None] * n + tags_n).ravel()  # new state (v, w) as v * N + w
+            values = candidates.ravel()
+            order = np.argsort(-values, kind="stable")
+            keys_sorted, first = np.unique(keys[order], return_index=True)
+            best = order[first]  # highest-scoring candidate for each distinct new state
+            if beam is not None and len(best) > beam:
+                best = best[np.argpartition(-values[best], beam - 1)[:beam]]
+            prev, cur, score = keys[best] // n, keys[best] % n, values[best]
+            tags_at.append(cur)
+            parents.append(best // n)
 
         # termination step. end to beginning
-        sequence = [max((V[-1][tag],tag) for tag in self.tags)[1]]
+        state = int(score.argmax())
+        sequence = []
+        for t in range(len(tokens) - 1, -1, -1):
+            sequence.append(tags_at[t][state])
+            if t:
+                state = parents[t][state]
+        return [self.tags[i] for i in reversed(sequence)]
+
+    def beam_tradeoff(self, sentences, beams=(1, 2, 4, 8, 16, 32, None)):
+        # tags the (word, tag) sentences with viterbi_tags_trigram at every beam width (None = exhaustive)
+        # and reports one row per setting: {"beam", "accuracy", "seconds", "tokens_per_second"}.
+        # the bigram viterbi_tags is included as beam "bigram" for reference.
+        sentences = [sentence for sentence in sentences if sentence]
+        words = [sentence_words(sentence) for sentence in sentences]
+        gold = [tag for sentence in sentences for (word, tag) in sentence]
+        tokens = len(gold)
+        rows = []
+        for beam in ("bigram",) + tuple(beams):
+            start = time.perf_counter()
+            if beam == "bigram":
+                tagged = [self.viterbi_tags(sentence) for sentence in words]
+            else:
+                tagged = [self.viterbi_tags_trigram(sentence, beam) for sentence in words]
+            seconds = time.perf_counter() - start
+            correct = sum(guess == answer for guess, answer in zip((tag for tags in tagged for tag in tags), gold))
+            rows.append({"beam": beam, "accuracy": correct / float(tokens) if tokens else 0.0,
+                         "seconds": seconds, "tokens_per_second": tokens / seconds if seconds else float("inf")})
+        return rows
 
-        for t in range(len(tokens)-1, 0 ,-1):
-            sequence.append(T[t][sequence[-1]])
+    def save(self, path):
+        # writes the compiled model in a compact binary form that Tagger.load maps straight into memory:
+        #   MODEL_MAGIC | header length (uint32) | JSON header | padding | data section
+        # the data section holds the vocabulary (words in emission-column order, "\n"-separated utf-8)
+        # and little-endian arrays (log_pi, log_a, log_b, log_a3 as float64, the best tag of every word as uint8),
+        # each starting on an 8-byte boundary. the header records the tags and each block's offset into the data.
+        words = sorted(self.words, key=self.words.get)
+        best = np.array([self.tag_index[self.word_tags[word]] for word in words], dtype=np.uint8)
+        blocks = [("vocabulary", "\n".join(words).encode("utf-8"))]
+        for name, array in (("log_pi", self.log_pi), ("log_a", self.log_a), ("log_b", self.log_b), ("log_a3", self.log_a3)):
+            blocks.append((name, np.ascontiguousarray(array, dtype="<f8").tobytes()))
+        blocks.append(("best_tags", best.tobytes()))
 
-        result = reversed(sequence)
-        return list(result)
+        header = {"tags": self.tags, "unknown_tag": self.unknown_tag, "tag_counts": self.tag_counts, "lambdas": self.lambdas,
+                  "words": len(words), "blocks": {}}
+        offset = 0
+        for name, data in blocks:
+            header["blocks"][name] = [offset, len(data)]
+            offset += _padded(len(data))
+        header = json.dumps(header).encode("utf-8")
+
+        with open(path, "wb") as file:
+            file.write(MODEL_MAGIC + struct.pack("<I", len(header)) + header)
+            file.write(b"\0" * (_padded(file.tell()) - file.tell()))
+            for name, data in blocks:
+                file.write(data + b"\0" * (_padded(len(data)) - len(data)))
         pass
+
+    @classmethod
+    def load(cls, path):
+        # a Tagger from a file written by save(), without retraining. the arrays are read-only views of a
+        # shared memory map, so any number of processes loading the same file share one copy of the model;
+        # only the word -> column dictionary is built per process.
+        # the raw count tables (ini_pi, tran_a, emiss_b) are not stored and are None on a loaded Tagger.
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(MODEL_MAGIC)] != MODEL_MAGIC:
+            raise ValueError("%s is not a saved Tagger model" % path)
+        start = len(MODEL_MAGIC) + 4
+        header_length = struct.unpack_from("<I", data, len(MODEL_MAGIC))[0]
+        header = json.loads(data[start:start + header_length].decode("utf-8"))
+        base = _padded(start + header_length)
+
+        def block(name, dtype):
+            offset, length = header["blocks"][name]
+            return np.frombuffer(data, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=base + offset)
+
+        tagger = cls.__new__(cls)
+        tagger.sentences = None
+        tagger.ini_pi = tagger.tran_a = tagger.emiss_b = None
+        tagger.tags = header["tags"]
+        tagger.tag_index = dict((tag, i) for i, tag in enumerate(tagger.tags))
+        tagger.tag_counts = header["tag_counts"]
+        n = len(tagger.tags)
+        tagger.log_pi = block("log_pi", "<f8")
+        tagger.log_a = block("log_a", "<f8").reshape(n, n)
+        tagger.log_b = block("log_b", "<f8").reshape(n, header["words"] + 1)
+        tagger.log_a3 = block("log_a3", "<f8").reshape(n + 1, n, n)
+        tagger.lambdas = tuple(header["lambdas"])
+
+        offset, length = header["blocks"]["vocabulary"]
+        words = data[base + offset:base + offset + length].decode("utf-8").split("\n") if header["words"] else []
+        tagger.words = dict((word, i) for i, word in enumerate(words))
+        tagger.unknown_column = len(words)
+        best = block("best_tags", np.uint8)
+        tagger.word_tags = dict(zip(words, [tagger.tags[i] for i in best]))
+        tagger.unknown_tag = header["unknown_tag"]
+        return tagger
+
+def deleted_interpolation(trigram, pair_total, a, tran_a, tags, unigram):
+    # (l3, l2, l1) weights for the trigram model (Brants, TnT): every trigram seen in training votes,
+    # with its count, for whichever of the trigram, bigram and unigram estimates still predicts it
+    # best once that one occurrence is taken out of the counts
+    weights = np.zeros(3)
+    total = unigram.sum()
+    for (u, v, w) in zip(*np.nonzero(trigram)):
+        count = trigram[u, v, w]
+        bigram = tran_a.get((tags[v], tags[w]), 0)
+        estimates = (
+            (count - 1) / (pair_total[u, v] - 1) if pair_total[u, v] > 1 else 0.0,
+            (bigram - 1) / (unigram[v] - 1) if unigram[v] > 1 else 0.0,
+            (unigram[w] - 1) / (total - 1) if total > 1 else 0.0)
+        weights[int(np.argmax(estimates))] += count
+    if not weights.sum():
+        return (0.0, 1.0, 0.0)
+    return tuple(weights / weights.sum())
+
+def _padded(size):
+    # size rounded up to the next multiple of 8
+    return (size + 7) & ~7
+
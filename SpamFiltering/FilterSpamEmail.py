@@ -2,10 +2,23 @@
 # Imports
 ############################################################
 import email
-from collections import defaultdict
+import email.iterators
+import email.message
+from array import array
+import hashlib
+import heapq
+import io
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+import json
 import math
+import mmap
+import os
 from os import listdir
 from os.path import isfile, join
+import struct
+import sys
 
 
 ############################################################
@@ -13,95 +26,571 @@ from os.path import isfile, join
 ############################################################
 
 def load_tokens(email_path):
-    opened_file = open(email_path)
-    message = email.message_from_file(opened_file)
-    email_body = email.iterators.body_line_iterator(message)
-    temp = [i for x in email_body for i in x.split()]
-    return temp
+    return list(iter_message_tokens(email_path))
     pass
 
+class FileContent(bytes):
+    # the raw bytes of an email file, read once (see TokenCache.read) and parsed as text the way the file's
+    # path would be, so a message read for its cache key is not read again to be parsed
+    pass
+
+def parse_message(source):
+    # an email.message.Message from a file path, the raw RFC822 bytes, or an already parsed message
+    if isinstance(source, email.message.Message):
+        return source
+    if isinstance(source, FileContent):
+        return email.message_from_file(io.TextIOWrapper(io.BytesIO(source)))
+    if isinstance(source, (bytes, bytearray)):
+        return email.message_from_bytes(source)
+    with open(source) as opened_file:
+        return email.message_from_file(opened_file)
+
+def iter_message_tokens(email_path):
+    # the whitespace-separated tokens of one email body, line by line; email_path may also be
+    # anything else parse_message accepts
+    message = parse_message(email_path)
+    for line in email.iterators.body_line_iterator(message):
+        for token in line.split():
+            yield token
+
+def iter_tokens(email_paths):
+    # streams the tokens of many emails; only one parsed message is held at a time
+    for path in email_paths:
+        for token in iter_message_tokens(path):
+            yield token
+
+def count_tokens(email_paths):
+    # token -> number of occurrences over all the emails, in a single pass
+    counts = Counter()
+    counts.update(iter_tokens(email_paths))
+    return counts
+
+def message_token_counts(emails):
+    # token -> count for each email, in order; the sparse vector bulk scoring takes a dot product with
+    return [Counter(iter_message_tokens(source)) for source in emails]
+
+def chunks_of(items, size):
+    # consecutive slices of items, size at a time
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def merge_counts(chunk_counts):
+    # adds up per-chunk Counters. merging consecutive chunks in order gives the same counts, in the
+    # same first-seen order, as one count_tokens over all of them
+    counts = Counter()
+    for chunk in chunk_counts:
+        counts.update(chunk)
+    return counts
+
 def log_probs(email_paths, smoothing):
-    vocabulary = [token for path in email_paths for token in load_tokens(path)]
-    result = defaultdict(float)
-    for token in vocabulary:
-        result[token] += 1
+    return log_probs_from_counts(count_tokens(email_paths), smoothing)
+    pass
 
-    vocabulary_in_set = set(vocabulary)
-    sum_of_words = len(vocabulary)
+def log_probs_from_counts(counts, smoothing):
+    # smoothed log P(token) from token counts, plus "<UNK>" for tokens never seen (log 1 = 0 when there
+    # are no counts at all); memory is bounded by the vocabulary, not by the number of tokens read
+    result = defaultdict(float)
+    sum_of_words = sum(counts.values())
     alpha = smoothing
-    num_vocabulary_V = len(vocabulary_in_set)
-    for words in vocabulary_in_set: #words = vs
-        result[words] = math.log((result[words] + alpha)/(sum_of_words + alpha * (num_vocabulary_V +1)))
-        result["<UNK>"] = math.log(alpha/(sum_of_words + alpha * (num_vocabulary_V +1)))
+    num_vocabulary_V = len(counts)
+    denominator = sum_of_words + alpha * (num_vocabulary_V + 1)
+    for words, count in counts.items(): #words = vs
+        result[words] = math.log((count + alpha)/denominator)
+    result["<UNK>"] = math.log(alpha/denominator)
     return result
-    pass
+
+class TokenCache(object):
+    # bounded LRU cache of tokenized emails keyed by a hash of their raw content, so an email scored again
+    # (a retry, a forwarded duplicate, a re-score after learn()) is not parsed again. each entry is the
+    # email's token ids as an array("I"); token strings are interned once in a table shared by the entries,
+    # and a token leaves the table with the last entry that holds it. max_bytes bounds the id arrays plus
+    # the table (each token's string and about TOKEN_OVERHEAD bytes of bookkeeping), least recently used
+    # entries first out. parsed email.message.Message objects have no raw content to hash and always
+    # bypass the cache.
+    TOKEN_OVERHEAD = 96
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> token ids, least recently used first
+        self.size = 0                 # bytes held by the id arrays and the intern table
+        self.ids = {}                 # token -> id
+        self.tokens = []              # id -> token, None for a free id
+        self.references = []          # id -> number of entries holding the token
+        self.free = []                # ids to reuse
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, source):
+        # the cache key of an email given as a path or raw bytes, None for a parsed message. the key also
+        # records which of the two it was, since a path is read as text and raw bytes are not
+        return self.read(source)[0]
+
+    def read(self, source):
+        # (key, email) for an email given as a path, raw bytes or a parsed message: its cache key, and the
+        # email to parse on a miss. a path's file is read here, once, and comes back as its FileContent
+        if isinstance(source, email.message.Message):
+            return None, source
+        if not isinstance(source, (bytes, bytearray)):
+            with open(source, "rb") as opened_file:
+                source = FileContent(opened_file.read())
+        kind = b"p" if isinstance(source, FileContent) else b"b"
+        return kind + hashlib.blake2b(source, digest_size=16).digest(), source
+
+    def get(self, key):
+        # token -> count of the cached email, or None (a miss)
+        ids = self.entries.get(key)
+        if ids is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        tokens = self.tokens
+        return Counter(tokens[i] for i in ids)
+
+    def put(self, key, counts):
+        # caches an email's token counts under key, evicting least recently used entries to stay in budget;
+        # an email too big for the budget on its own is not kept
+        if key in self.entries:
+            self.release(self.entries.pop(key))
+        itemsize = array("I").itemsize
+        alone = sum(counts.values()) * itemsize + sum(sys.getsizeof(token) + self.TOKEN_OVERHEAD for token in counts)
+        if alone > self.max_bytes:
+            return
+        token_ids = dict((token, self.intern(token)) for token in counts)
+        ids = array("I", (token_ids[token] for token in counts.elements()))
+        self.entries[key] = ids
+        self.size += len(ids) * ids.itemsize
+        while self.size > self.max_bytes:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.release(evicted)
+            self.evictions += 1
+
+    def intern(self, token):
+        # the id of token, taking one reference to it for the entry being put
+        token_id = self.ids.get(token)
+        if token_id is None:
+            if self.free:
+                token_id = self.free.pop()
+                self.tokens[token_id] = token
+            else:
+                token_id = len(self.tokens)
+                self.tokens.append(token)
+                self.references.append(0)
+            self.ids[token] = token_id
+            self.size += sys.getsizeof(token) + self.TOKEN_OVERHEAD
+        self.references[token_id] += 1
+        return token_id
+
+    def release(self, ids):
+        # drops an entry's id array and its references, removing tokens no other entry holds
+        self.size -= len(ids) * ids.itemsize
+        references, tokens = self.references, self.tokens
+        for token_id in set(ids):
+            references[token_id] -= 1
+            if not references[token_id]:
+                token = tokens[token_id]
+                del self.ids[token]
+                tokens[token_id] = None
+                self.free.append(token_id)
+                self.size -= sys.getsizeof(token) + self.TOKEN_OVERHEAD
+
+    def token_counts(self, source):
+        # token -> count of one email, from the cache when its content has been seen before
+        key, source = self.read(source)
+        counts = self.get(key) if key is not None else None
+        if counts is None:
+            counts = Counter(iter_message_tokens(source))
+            if key is not None:
+                self.put(key, counts)
+        return counts
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries), "bytes": self.size, "tokens": len(self.ids)}
+
+MODEL_MAGIC = b"SPAMFLT2"  # first bytes of a file written by SpamFilter.save
+
+class CountTable(Mapping):
+    # read-only token -> count mapping over a saved model: token ids come from a shared vocabulary dictionary
+    # and the counts from an array (a view of the memory-mapped file). iterates this class's tokens in the
+    # order they were first counted; tokens this class never saw (count 0) are missing.
+
+    def __init__(self, vocabulary, tokens, counts, order):
+        self.vocabulary = vocabulary  # token -> id
+        self.tokens = tokens          # id -> token
+        self.counts = counts          # id -> count, 0 for tokens this class never saw
+        self.order = order            # ids of this class's tokens in first-counted order
+
+    def __getitem__(self, token):
+        count = self.counts[self.vocabulary[token]]
+        if not count:
+            raise KeyError(token)
+        return count
+
+    def __contains__(self, token):
+        try:
+            self[token]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        tokens = self.tokens
+        for i in self.order:
+            yield tokens[i]
+
+    def __len__(self):
+        return len(self.order)
+
+class SmoothedLogProbs(Mapping):
+    # token -> smoothed log probability computed on demand from one class's token counts. same keys, order
+    # and values as the dictionary log_probs_from_counts builds from those counts, "<UNK>" included,
+    # without a pass over the vocabulary.
+
+    def __init__(self, counts, total, smoothing):
+        self.counts = counts
+        self.smoothing = smoothing
+        self.denominator = total + smoothing * (len(counts) + 1)
+
+    def __getitem__(self, token):
+        if token == "<UNK>":
+            return math.log(self.smoothing/self.denominator)
+        count = self.counts.get(token)
+        if not count:
+            raise KeyError(token)
+        return math.log((count + self.smoothing)/self.denominator)
+
+    def __contains__(self, token):
+        return token in self.counts or token == "<UNK>"
+
+    def __iter__(self):
+        for token in self.counts:
+            yield token
+        yield "<UNK>"
+
+    def __len__(self):
+        return len(self.counts) + 1
 
 class SpamFilter(object):
 
-    def __init__(self, spam_dir, ham_dir, smoothing):
+    def __init__(self, spam_dir, ham_dir, smoothing, workers=1, chunksize=64, token_cache=None):
+        # workers > 1 (None: one per CPU) parses and counts the mail in a process pool, chunksize
+        # emails per task; the trained filter is the same as with serial training. token_cache, a
+        # TokenCache, lets scoring and learn() skip parsing emails whose content was seen before
         spam_paths = [join(spam_dir, f) for f in listdir(spam_dir) if isfile(join(spam_dir, f))]
         ham_paths = [join(ham_dir, f) for f in listdir(ham_dir) if isfile(join(ham_dir, f))]
 
-        self.spam_dict = log_probs(spam_paths, smoothing)
-        self.ham_dict = log_probs(ham_paths, smoothing)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                spam_chunks = executor.map(count_tokens, chunks_of(spam_paths, chunksize))
+                ham_chunks = executor.map(count_tokens, chunks_of(ham_paths, chunksize))
+                spam_counts = merge_counts(spam_chunks)
+                ham_counts = merge_counts(ham_chunks)
+        else:
+            spam_counts = count_tokens(spam_paths)
+            ham_counts = count_tokens(ham_paths)
 
-        self.p_spam = math.log(float(len(spam_paths))/(len(ham_paths)+len(spam_paths)))
-        self.p_ham = 1 - self.p_spam
+        # the model is kept as raw counts so that learn() and unlearn() cost time proportional to the
+        # message; spam_dict, ham_dict and the priors are derived from them on demand
+        self.smoothing = smoothing
+        self.counts = {"spam": spam_counts, "ham": ham_counts}
+        self.totals = {"spam": sum(spam_counts.values()), "ham": sum(ham_counts.values())}
+        self.messages = {"spam": len(spam_paths), "ham": len(ham_paths)}
+        self.version = 0     # bumped by every learn() and unlearn()
+        self.token_cache = token_cache
+        self._dicts = {}     # label -> SmoothedLogProbs for the current counts
+        self._log_odds = None
+        self._rankings = {}  # label -> (version, heap, ranked prefix), see most_indicative()
         pass
 
+    @property
+    def spam_dict(self):
+        return self.log_prob_table("spam")
 
-    def is_spam(self, email_path):
-        vocabulary = load_tokens(email_path)
-        prob_spam_sum = self.p_spam
-        prob_ham_sum = self.p_ham
-        for token in vocabulary:
-            if token in self.spam_dict:
-                prob_spam_sum += self.spam_dict[token]
-            else:
-                prob_spam_sum += self.spam_dict["<UNK>"]
+    @property
+    def ham_dict(self):
+        return self.log_prob_table("ham")
 
-            if token in self.ham_dict:
-                prob_ham_sum += self.ham_dict[token]
-            else:
-                prob_ham_sum += self.ham_dict["<UNK>"]
+    def log_prob_table(self, label):
+        # token -> smoothed log P(token | label), "<UNK>" included, for the current counts
+        if label not in self._dicts:
+            self._dicts[label] = SmoothedLogProbs(self.counts[label], self.totals[label], self.smoothing)
+        return self._dicts[label]
+
+    @property
+    def p_spam(self):
+        return self.log_prior("spam")
+
+    @property
+    def p_ham(self):
+        return self.log_prior("ham")
+
+    def log_prior(self, label):
+        # log of label's share of the messages. while a class has none (a filter started from empty
+        # directories and built up with learn()), every class counts one message more, so that neither
+        # prior is log 0
+        spam, ham = self.messages["spam"], self.messages["ham"]
+        extra = 0 if spam and ham else 1
+        return math.log(float(self.messages[label] + extra)/(spam + ham + 2 * extra))
+
+    def learn(self, message, label):
+        # adds one labelled email (a path, raw bytes, a parsed message, or a token -> count mapping) to the
+        # model without retraining; label is "spam" or "ham"
+        self._update(message, label, 1)
+
+    def unlearn(self, message, label):
+        # takes back an email previously given to learn() (or to the constructor) with the same label,
+        # e.g. to move a misfiled message to the other class
+        self._update(message, label, -1)
+
+    def _update(self, message, label, sign):
+        if label not in self.counts:
+            raise ValueError("label must be 'spam' or 'ham', not %r" % (label,))
+        counts = message if isinstance(message, Mapping) else self.token_counts(message)
+        class_counts = self.counts[label]
+        if sign < 0:
+            if self.messages[label] < 1 or any(class_counts.get(token, 0) < count for token, count in counts.items()):
+                raise ValueError("the message was not learned as %s" % label)
+        if not isinstance(class_counts, Counter):
+            # a loaded model's counts are read-only views of the file; copy them on the first update
+            class_counts = self.counts[label] = Counter(class_counts)
+
+        for token, count in counts.items():
+            class_counts[token] += sign * count
+            if not class_counts[token]:
+                del class_counts[token]
+        self.totals[label] += sign * sum(counts.values())
+        self.messages[label] += sign
+        self.version += 1
+
+        # the smoothing denominators changed, so the log-probability views are rebuilt; the log-odds
+        # table only depends on the counts of the tokens in this message
+        log_odds = self._log_odds
+        self._dicts = {}
+        if log_odds is not None:
+            for token in counts:
+                weight = self._token_log_odds(token)
+                if weight is None:
+                    log_odds.pop(token, None)
+                else:
+                    log_odds[token] = weight
+        pass
+
+    def _token_log_odds(self, token):
+        spam_count = self.counts["spam"].get(token, 0)
+        ham_count = self.counts["ham"].get(token, 0)
+        if not spam_count and not ham_count:
+            return None
+        return math.log(spam_count + self.smoothing) - math.log(ham_count + self.smoothing)
+
+    def log_odds(self):
+        # token -> log(count in spam + smoothing) - log(count in ham + smoothing) for every token either class
+        # saw. log P(token | spam) - log P(token | ham) is this plus log_odds_offset(), which is the same for
+        # every token, and tokens neither class saw only contribute the offset. scoring a message is then one
+        # lookup per token; the table is built on first use and kept up to date by learn() and unlearn()
+        if self._log_odds is None:
+            weights = {}
+            for label in ("spam", "ham"):
+                for token in self.counts[label]:
+                    if token not in weights:
+                        weights[token] = self._token_log_odds(token)
+            self._log_odds = weights
+        return self._log_odds
+
+    def log_odds_offset(self):
+        # log of the ham smoothing denominator minus that of spam, see log_odds()
+        return math.log(self.ham_dict.denominator) - math.log(self.spam_dict.denominator)
+
+    def score_counts(self, counts):
+        # log P(spam | message) - log P(ham | message) up to the shared evidence term, for a message given as
+        # token -> count: the prior log-odds plus the dot product of the counts with the token log-odds
+        weights = self.log_odds()
+        score = self.p_spam - self.p_ham
+        length = 0
+        for token, count in counts.items():
+            score += count * weights.get(token, 0.0)
+            length += count
+        return score + length * self.log_odds_offset()
+
+
+    def token_counts(self, email_path):
+        # token -> count of one email, through the token cache if there is one
+        if self.token_cache is None:
+            return Counter(iter_message_tokens(email_path))
+        return self.token_cache.token_counts(email_path)
 
-        return prob_spam_sum >= prob_ham_sum
+    def score(self, email_path):
+        # the log-odds score of one email (a path, raw bytes, or a parsed message); positive leans spam
+        return self.score_counts(self.token_counts(email_path))
+
+    def classify_batch(self, emails, workers=1, chunksize=64):
+        # (score, is_spam) for each of many emails, in order. emails are paths, raw RFC822 bytes or parsed
+        # messages; with workers > 1 (None: one per CPU) they are parsed in a process pool, chunksize
+        # emails per task, and only their token counts come back to be scored here. with a token cache
+        # only the emails missing from it are parsed
+        emails = list(emails)
+        cache = self.token_cache
+        keys = [None] * len(emails)
+        if cache is not None:
+            # each file is read once: a miss is parsed from the content its key was taken from
+            for i, source in enumerate(emails):
+                keys[i], emails[i] = cache.read(source)
+        counts = [cache.get(key) if key is not None else None for key in keys]
+        missing = [i for i, message_counts in enumerate(counts) if message_counts is None]
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1 and missing:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunks = executor.map(message_token_counts, chunks_of([emails[i] for i in missing], chunksize))
+                parsed = [message for chunk in chunks for message in chunk]
+        else:
+            parsed = message_token_counts([emails[i] for i in missing])
+        for i, message_counts in zip(missing, parsed):
+            counts[i] = message_counts
+            if keys[i] is not None:
+                cache.put(keys[i], message_counts)
+
+        results = []
+        for message_counts in counts:
+            score = self.score_counts(message_counts)
+            results.append((score, score >= 0))
+        return results
+
+
+    def is_spam(self, email_path):
+        # prob_spam_sum >= prob_ham_sum, i.e. a log-odds score of at least 0
+        return self.score(email_path) >= 0
         pass
 
 
-    def most_indicative_spam(self, n):
-        #self.spam_dict = log_probs(spam_paths, smoothing)
-        #self.ham_dict = log_probs(ham_paths, smoothing)
+    def most_indicative_spam(self, n, start=0):
         # if word = win
         # P(W|S) = probability of the word "win" being in a spam message
             # = P(s|w) * P(w) / P(s)
         # P(S) = probability of a spam message overall
         # P(W) = probability of the word "win" in a message overall
+        # ranks the tokens of ham_dict by log(P(W|H) / (P(W|H) + P(W|S))), smallest first; start pages
+        # through the ranking
+        return self.most_indicative("spam", n, start)
+        pass
 
-        most_indicative_s = [] #tuple
-        for token, log_prob in self.ham_dict.items():
-            if token in self.spam_dict:
-                result =log_prob - (math.log(math.exp(self.ham_dict[token]) + math.exp(self.spam_dict[token])))
-            else:
-                result = log_prob - (math.log(math.exp(self.ham_dict[token]) + math.exp(self.spam_dict["<UNK>"]))) #"UNK"
-            most_indicative_s.append((token, result))
 
-        most_indicative_s.sort(key=lambda x: x[1])
-        output = list(map(lambda x: x[0],most_indicative_s))
-        return output[:n]
+    def most_indicative_ham(self, n, start=0):
+        return self.most_indicative("ham", n, start)
         pass
 
+    def most_indicative(self, label, n, start=0):
+        # the tokens ranked start .. start + n - 1 among the most indicative of label. the scores are computed
+        # once per model version into a heap; queries pop only as far as they need and the popped prefix is
+        # kept, so small top-n queries and paging never sort the whole vocabulary
+        version, heap, ranked = self._rankings.get(label, (None, None, None))
+        if version != self.version:
+            heap = self.indicative_scores(label)
+            heapq.heapify(heap)
+            ranked = []
+            self._rankings[label] = (self.version, heap, ranked)
+        while len(ranked) < start + n and heap:
+            ranked.append(heapq.heappop(heap))
+        return [token for score, position, token in ranked[start:start + n]]
 
-    def most_indicative_ham(self, n):
-        most_indicative_h = [] #tuple
-        for token, log_prob in self.spam_dict.items():
-            if token in self.ham_dict:
-                result =log_prob - (math.log(math.exp(self.spam_dict[token]) + math.exp(self.ham_dict[token])))
-            else:
-                result = log_prob - (math.log(math.exp(self.spam_dict[token]) + math.exp(self.ham_dict["<UNK>"]))) #"UNK"
-            most_indicative_h.append((token, result))
+    def indicative_scores(self, label):
+        # (score, position, token) for every token of the other class's dictionary, "<UNK>" included: the
+        # log of that class's share of the token's probability, log(P(W|other) / (P(W|other) + P(W|label))),
+        # computed with a stable log-sum-exp. low scores are the most indicative of label, ties go to the
+        # earlier dictionary position
+        other = self.ham_dict if label == "spam" else self.spam_dict
+        this = self.spam_dict if label == "spam" else self.ham_dict
+        this_unknown = this["<UNK>"]
+        scores = []
+        for position, (token, log_prob) in enumerate(other.items()):
+            this_log_prob = this[token] if token in this else this_unknown
+            scores.append((log_prob - log_sum_exp(log_prob, this_log_prob), position, token))
+        return scores
 
-        most_indicative_h.sort(key=lambda x: x[1])
-        output = list(map(lambda x: x[0],most_indicative_h))
-        return output[:n]
+    def save(self, path):
+        # writes the trained filter in a compact binary form that SpamFilter.load maps straight into memory:
+        #   MODEL_MAGIC | header length (uint32) | JSON header | padding | data section
+        # the data section is the interned vocabulary ("\n"-separated utf-8, every token seen by either class,
+        # in id order), then for each class its token counts as an int64 array indexed by token id (0 where
+        # the class never saw the token) and the uint32 ids of its tokens in first-counted order.
+        # blocks start on 8-byte boundaries; the header records their offsets into the data section
+        # along with the smoothing, the token totals and the number of messages of each class.
+        tokens = list(self.counts["spam"])
+        seen = set(tokens)
+        tokens.extend(token for token in self.counts["ham"] if token not in seen)
+        ids = dict((token, i) for i, token in enumerate(tokens))
+        blocks = [("vocabulary", "\n".join(tokens).encode("utf-8"))]
+        for label in ("spam", "ham"):
+            counts = self.counts[label]
+            blocks.append((label, array("q", (counts.get(token, 0) for token in tokens)).tobytes()))
+            blocks.append((label + "_order", array("I", (ids[token] for token in counts)).tobytes()))
+
+        header = {"byteorder": sys.byteorder, "id_size": array("I").itemsize, "count_size": array("q").itemsize,
+                  "tokens": len(tokens), "smoothing": self.smoothing, "totals": self.totals, "messages": self.messages,
+                  "blocks": {}}
+        offset = 0
+        for name, data in blocks:
+            header["blocks"][name] = [offset, len(data)]
+            offset += padded(len(data))
+        header = json.dumps(header).encode("utf-8")
+
+        with open(path, "wb") as file:
+            file.write(MODEL_MAGIC + struct.pack("<I", len(header)) + header)
+            file.write(b"\0" * (padded(file.tell()) - file.tell()))
+            for name, data in blocks:
+                file.write(data + b"\0" * (padded(len(data)) - len(data)))
         pass
+
+    @classmethod
+    def load(cls, path, token_cache=None):
+        # a SpamFilter from a file written by save(), without re-reading any mail. the token counts become
+        # CountTables over read-only views of a shared memory map, so worker processes loading the same
+        # file share one copy of them; only the token -> id dictionary is per process. a class's counts
+        # are copied into memory the first time learn() or unlearn() changes them.
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(MODEL_MAGIC)] != MODEL_MAGIC:
+            raise ValueError("%s is not a saved SpamFilter model" % path)
+        start = len(MODEL_MAGIC) + 4
+        header_length = struct.unpack_from("<I", data, len(MODEL_MAGIC))[0]
+        header = json.loads(data[start:start + header_length].decode("utf-8"))
+        if (header["byteorder"] != sys.byteorder or header["id_size"] != array("I").itemsize
+                or header["count_size"] != array("q").itemsize):
+            raise ValueError("%s was saved on a machine with a different array layout" % path)
+        base = padded(start + header_length)
+        view = memoryview(data)
+
+        def block(name):
+            offset, length = header["blocks"][name]
+            return view[base + offset:base + offset + length]
+
+        tokens = bytes(block("vocabulary")).decode("utf-8").split("\n") if header["tokens"] else []
+        vocabulary = dict((token, i) for i, token in enumerate(tokens))
+
+        spam_filter = cls.__new__(cls)
+        spam_filter.smoothing = header["smoothing"]
+        spam_filter.counts = dict((label, CountTable(vocabulary, tokens, block(label).cast("q"),
+                                                     block(label + "_order").cast("I")))
+                                  for label in ("spam", "ham"))
+        spam_filter.totals = header["totals"]
+        spam_filter.messages = header["messages"]
+        spam_filter.version = 0
+        spam_filter.token_cache = token_cache
+        spam_filter._dicts = {}
+        spam_filter._log_odds = None
+        spam_filter._rankings = {}
+        return spam_filter
+
+def log_sum_exp(a, b):
+    # log(exp(a) + exp(b)) without overflow or underflow
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+def padded(size):
+    # size rounded up to the next multiple of 8
+    return (size + 7) & ~7
+
@@ -0,0 +1,355 @@
+############################################################
+# Imports
+############################################################
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+from os import listdir
+from os.path import isfile, join
+import struct
+import time
+
+from FilterSpamEmail import SpamFilter, TokenCache, chunks_of, message_token_counts
+
+
+############################################################
+# Section 1: Framing
+############################################################
+
+# every request and response is one frame: a 4-byte big-endian payload length, then the payload. a request
+# payload is a raw RFC822 message, or empty to ask for the server's stats; a response payload is JSON,
+# {"score": ..., "spam": ...} for a message. a connection may pipeline requests, and its responses come
+# back in request order.
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+
+async def read_frame(reader):
+    # the payload of the next frame, or None when the peer closed the connection between frames
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise
+        return None
+    length = FRAME_HEADER.unpack(header)[0]
+    if length > MAX_FRAME:
+        raise ValueError("frame of %d bytes is over the %d byte limit" % (length, MAX_FRAME))
+    return await reader.readexactly(length)
+
+def write_frame(writer, payload):
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+
+def percentiles(seconds):
+    # nearest-rank p50 and p99 of latencies in seconds, in milliseconds
+    if not seconds:
+        return {"p50_ms": None, "p99_ms": None}
+    ordered = sorted(seconds)
+    rank = lambda p: ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))]
+    return {"p50_ms": rank(50) * 1000, "p99_ms": rank(99) * 1000}
+
+
+############################################################
+# Section 2: Scoring Server
+############################################################
+
+class ScoringServer(object):
+    # asyncio front end for a trained SpamFilter. requests that arrive within max_delay seconds of each other
+    # (up to max_batch of them) are scored as one micro-batch: the messages are parsed in executor (None:
+    # the event loop's default thread pool; a ProcessPoolExecutor parses in parallel), parse_chunk messages
+    # per task, then scored together in the event loop. at most max_pending requests are in flight, from
+    # frame read until the response has been handed to a socket that drained it; past that the server stops
+    # reading from its sockets, so clients (including one that sends but never reads) feel backpressure
+    # through TCP flow control and no connection buffers more than max_pending responses.
+    # the latencies of the last latency_window requests, from frame received to response ready, are kept
+    # for stats().
+
+    def __init__(self, spam_filter, executor=None, max_batch=64, max_delay=0.002, max_pending=1024,
+                 parse_chunk=16, latency_window=10000):
+        self.spam_filter = spam_filter
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.parse_chunk = parse_chunk
+        self.latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.server = None
+        self._connections = set()
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        # listens on a Unix socket at path, or else on host:port (port 0 picks a free one)
+        self._queue = asyncio.Queue()
+        self._pending = asyncio.Semaphore(self.max_pending)
+        self._batcher = asyncio.ensure_future(self._run_batches())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._serve_connection, path=path)
+        else:
+            self.server = await asyncio.start_server(self._serve_connection, host, port)
+        return self.server
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        # stops listening and ends the open connections; requests they already sent are still answered
+        self.server.close()
+        connections = list(self._connections)
+        for connection in connections:
+            connection.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+        await self.server.wait_closed()
+        self._batcher.cancel()
+
+    def stats(self):
+        stats = {"requests": self.requests, "batches": self.batches, "errors": self.errors,
+                 "mean_batch": float(self.requests) / self.batches if self.batches else 0.0,
+                 "in_flight": self.in_flight}
+        stats.update(percentiles(self.latencies))
+        if self.spam_filter.token_cache is not None:
+            stats["token_cache"] = self.spam_filter.token_cache.stats()
+        return stats
+
+    async def _serve_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        responses = asyncio.Queue()  # futures of this connection's responses, in request order
+        sender = asyncio.ensure_future(self._send_responses(responses, writer))
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload is None:
+                    break
+                future = loop.create_future()
+                await self._pending.acquire()  # released by _send_responses once the response is written
+                self.in_flight += 1
+                if payload:
+                    await self._queue.put((payload, time.perf_counter(), future))
+                else:
+                    future.set_result(json.dumps(self.stats()).encode("utf-8"))
+                await responses.put(future)
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    async def _send_responses(self, responses, writer):
+        # writes the responses in order, releasing each request's backpressure slot once its response has
+        # drained; after the peer goes away the rest are still awaited, so the requests already queued
+        # release their slots too
+        connected = True
+        while True:
+            future = await responses.get()
+            if future is None:
+                return
+            try:
+                payload = await future
+                if connected:
+                    try:
+                        write_frame(writer, payload)
+                        await writer.drain()
+                    except ConnectionError:
+                        connected = False
+            finally:
+                self._pending.release()
+                self.in_flight -= 1
+
+    async def _run_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._take_queued(batch)
+            if len(batch) < self.max_batch and self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+                self._take_queued(batch)
+            await self._score_batch(batch)
+
+    def _take_queued(self, batch):
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _score_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        spam_filter = self.spam_filter
+        payloads = [payload for payload, started, future in batch]
+        cache = spam_filter.token_cache
+        keys = [cache.key(payload) for payload in payloads] if cache is not None else [None] * len(payloads)
+        counts = [cache.get(key) if key is not None else None for key in keys]
+        missing = [i for i, message_counts in enumerate(counts) if message_counts is None]
+        try:
+            chunks = await asyncio.gather(*(loop.run_in_executor(self.executor, message_token_counts, chunk)
+                                            for chunk in chunks_of([payloads[i] for i in missing], self.parse_chunk)))
+            for i, message_counts in zip(missing, (message for chunk in chunks for message in chunk)):
+                counts[i] = message_counts
+                if keys[i] is not None:
+                    cache.put(keys[i], message_counts)
+            responses = []
+            for message_counts in counts:
+                score = spam_filter.score_counts(message_counts)
+                responses.append({"score": score, "spam": score >= 0})
+        except Exception as error:
+            self.errors += len(batch)
+            responses = [{"error": "%s: %s" % (type(error).__name__, error)}] * len(batch)
+
+        now = time.perf_counter()
+        for (payload, started, future), response in zip(batch, responses):
+            future.set_result(json.dumps(response).encode("utf-8"))
+            self.latencies.append(now - started)
+        self.requests += len(batch)
+        self.batches += 1
+
+
+############################################################
+# Section 3: Load Generator
+############################################################
+
+async def open_connection(host="127.0.0.1", port=8025, path=None):
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+async def score_messages(messages, host="127.0.0.1", port=8025, path=None):
+    # the server's response for each raw message, sent pipelined over one connection
+    reader, writer = await open_connection(host, port, path)
+    for message in messages:
+        write_frame(writer, message)
+    await writer.drain()
+    responses = [json.loads(await read_frame(reader)) for message in messages]
+    writer.close()
+    await writer.wait_closed()
+    return responses
+
+async def server_stats(host="127.0.0.1", port=8025, path=None):
+    reader, writer = await open_connection(host, port, path)
+    write_frame(writer, b"")
+    stats = json.loads(await read_frame(reader))
+    writer.close()
+    await writer.wait_closed()
+    return stats
+
+async def generate_load(messages, host="127.0.0.1", port=8025, path=None, connections=8, requests=1000, window=16):
+    # sends requests raw messages (cycling through messages) over connections connections, each keeping up
+    # to window requests in flight, and reports client-side throughput and p50/p99 latency along with the
+    # server's own stats
+    latencies = []
+
+    async def connection(count, offset):
+        reader, writer = await open_connection(host, port, path)
+        in_flight = asyncio.Semaphore(window)
+        sent = deque()
+
+        async def send():
+            for i in range(count):
+                await in_flight.acquire()
+                sent.append(time.perf_counter())
+                write_frame(writer, messages[(offset + i) % len(messages)])
+                await writer.drain()
+
+        sender = asyncio.ensure_future(send())
+        for i in range(count):
+            json.loads(await read_frame(reader))
+            latencies.append(time.perf_counter() - sent.popleft())
+            in_flight.release()
+        await sender
+        writer.close()
+        await writer.wait_closed()
+
+    share, extra = divmod(requests, connections)
+    started = time.perf_counter()
+    await asyncio.gather(*(connection(share + (i < extra), i * share) for i in range(connections)))
+    seconds = time.perf_counter() - started
+    report = {"requests": requests, "seconds": seconds, "per_second": requests / seconds if seconds else None}
+    report.update(percentiles(latencies))
+    report["server"] = await server_stats(host, port, path)
+    return report
+
+def read_messages(directories):
+    # the raw bytes of every file in the directories
+    messages = []
+    for directory in directories:
+        for f in sorted(listdir(directory)):
+            if isfile(join(directory, f)):
+                with open(join(directory, f), "rb") as opened_file:
+                    messages.append(opened_file.read())
+    return messages
+
+
+############################################################
+# Section 4: Command Line
+############################################################
+
+def make_server(args):
+    # the server and the process pool it parses in, which close_server shuts down
+    spam_filter = SpamFilter.load(args.model, token_cache=TokenCache(args.cache_mb * 1024 * 1024) if args.cache_mb else None)
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    return ScoringServer(spam_filter, executor, max_batch=args.max_batch, max_delay=args.max_delay_ms / 1000.0,
+                         max_pending=args.max_pending)
+
+async def close_server(server):
+    await server.close()
+    if server.executor is not None:
+        server.executor.shutdown()
+
+async def serve(args):
+    server = make_server(args)
+    await server.start(args.host, args.port, args.unix)
+    print("scoring on %s" % (server.address(),))
+    try:
+        while True:
+            await asyncio.sleep(args.report_every)
+            print(json.dumps(server.stats()))
+    finally:
+        await close_server(server)
+
+async def load(args):
+    # with --model, also runs the server in this process on a free localhost port: an end-to-end check
+    server = None
+    host, port, path = args.host, args.port, args.unix
+    if args.model:
+        server = make_server(args)
+        await server.start(host, 0 if path is None else port, path)
+        if path is None:
+            port = server.address()[1]
+    try:
+        report = await generate_load(read_messages(args.mail), host, port, path, args.connections, args.requests, args.window)
+        print(json.dumps(report, indent=2))
+    finally:
+        if server is not None:
+            await close_server(server)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SpamFilter scoring server and load generator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="serve a model saved with SpamFilter.save")
+    serve_parser.add_argument("model")
+    serve_parser.add_argument("--report-every", type=float, default=10.0, help="seconds between stats lines")
+    load_parser = commands.add_parser("load", help="send the mail in some directories to a server")
+    load_parser.add_argument("mail", nargs="+", help="directories of raw messages")
+    load_parser.add_argument("--model", help="start a server for this model in-process first")
+    load_parser.add_argument("--connections", type=int, default=8)
+    load_parser.add_argument("--requests", type=int, default=1000)
+    load_parser.add_argument("--window", type=int, default=16, help="requests in flight per connection")
+    for command in (serve_parser, load_parser):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=8025)
+        command.add_argument("--unix", help="Unix socket path instead of TCP")
+        command.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parsing processes")
+        command.add_argument("--max-batch", type=int, default=64)
+        command.add_argument("--max-delay-ms", type=float, default=2.0)
+        command.add_argument("--max-pending", type=int, default=1024)
+        command.add_argument("--cache-mb", type=int, default=0, help="token cache budget, 0 for none")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args) if args.command == "serve" else load(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
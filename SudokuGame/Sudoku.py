@@ -2,151 +2,901 @@
 # Imports
 ############################################################
 
-from copy import deepcopy
-from queue import Queue
+from collections import deque, namedtuple
+from collections.abc import MutableMapping
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations, islice
+from math import isqrt
+import os
+import time
 
 
 ############################################################
 # Section 1: Sudoku
 ############################################################
 
-def sudoku_cells():
+# A board of box size n has size = n * n rows, columns, blocks and values (9 for the classic puzzle).
+# Cells are numbered row * size + column, and each cell keeps a candidate mask in which
+# bit (v - 1) is set while value v is still possible.
+
+SYMBOLS = "123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ" # value v is written as SYMBOLS[v - 1]
+BLANKS = ".0*"
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # before Python 3.10
+    def popcount(mask):
+        return bin(mask).count("1")
+
+def values_to_mask(values):
+    #packs a collection of values 1..size into a candidate mask
+    mask = 0
+    for value in values:
+        mask |= 1 << (value - 1)
+    return mask
+
+def mask_to_values(mask):
+    #unpacks a candidate mask back into the set of values it holds
+    return {value + 1 for value in bits_of(mask)}
+
+def bits_of(mask):
+    #positions of the set bits in mask, lowest first
+    positions = []
+    while mask:
+        low = mask & -mask
+        positions.append(low.bit_length() - 1)
+        mask ^= low
+    return positions
+
+def is_single(mask):
+    #True when exactly one candidate is left in the mask
+    return mask != 0 and mask & (mask - 1) == 0
+
+def sudoku_cells(size=9):
     #returns the list of all cells in a Sudoku puzzle as (row, column) pairs.
-    return [(row,column) for row in range(9) for column in range(9)]
+    return [(row,column) for row in range(size) for column in range(size)]
     pass
 
-def sudoku_arcs():
+def sudoku_units(box_size=3):
+    #returns the rows, columns and blocks of the puzzle, each as a tuple of cell indices
+    size = box_size * box_size
+    rows = [tuple(row * size + column for column in range(size)) for row in range(size)]
+    columns = [tuple(row * size + column for row in range(size)) for column in range(size)]
+    blocks = [tuple((block_row + i) * size + block_col + j for i in range(box_size) for j in range(box_size))
+              for block_row in range(0, size, box_size) for block_col in range(0, size, box_size)]
+    return rows + columns + blocks
+
+def diagonal_units(box_size=3):
+    #the two main diagonals, which the diagonal ("X") variant also requires to hold every value once
+    size = box_size * box_size
+    return [tuple(i * size + i for i in range(size)),
+            tuple(i * size + size - 1 - i for i in range(size))]
+
+def sudoku_peers(units, cell_count=81):
+    #returns, for every cell index, the sorted tuple of the other cell indices sharing a unit with it
+    #(the work is proportional to the number of arcs, i.e. the sum of the squared unit sizes)
+    peers = [set() for i in range(cell_count)]
+    for unit in units:
+        for i in unit:
+            peers[i].update(unit)
+    return [tuple(sorted(peer - {i})) for i, peer in enumerate(peers)]
+
+def sudoku_cell_units(units, cell_count=81):
+    #returns, for every cell index, the (unit index, position inside the unit) pairs of the units it belongs to
+    cell_units = [[] for i in range(cell_count)]
+    for u, unit in enumerate(units):
+        for pos, i in enumerate(unit):
+            cell_units[i].append((u, pos))
+    return [tuple(pairs) for pairs in cell_units]
+
+def sudoku_arcs(box_size=3):
     #returns the list of all arcs between cells in a Sudoku puzzle corresponding to inequality constraints. (each arc should be a pair of cells whose values != in a solved puzzle)
     ##order does not matter
-    arcs = []
-    for rowcol1 in sudoku_cells():
-        for rowcol2 in sudoku_cells():
-            if rowcol1 != rowcol2:
-                if (rowcol1[0] == rowcol2[0] or rowcol1[1] == rowcol2[1]) or (int(rowcol1[0]/3) == int(rowcol2[0]/3) and int(rowcol1[1]/3) == int(rowcol2[1]/3)):
-                    arcs.append((rowcol1,rowcol2))
-    return arcs  #should be represented a two-tuples of cells, where cells themselves are (row, column) pairs.
+    return SudokuGrid.get(box_size).arcs  #should be represented a two-tuples of cells, where cells themselves are (row, column) pairs.
     pass
 
 def read_board(path):
     #reads the board specified by the file at thegiven path and returns it as a dictionary
-    #puzzles represented textually as 9 lines of 9 characters each
-    # digit between "1" and "9" denotes a cell containing a fixed value
-    # asterisk "*" denotes a blank cell that could contain any digit
-    file = open(path, 'r')
+    #puzzles represented textually as N lines of N characters each (N = 9, 16, 25, ...)
+    # digit between "1" and "9", then "A", "B", ... for 10, 11, ..., denotes a cell containing a fixed value
+    # asterisk "*" (or "." / "0") denotes a blank cell that could contain any value
+    # a row may also be written as N whitespace-separated numbers, for the larger grids
+    with open(path, 'r') as file:
+        lines = [line.rstrip("\r\n") for line in file if line.strip()]
+    size = len(lines)
     board_dic = {}
-    for rows, line in enumerate(file): #('0','821*****7')
-        for column, item in enumerate(line): #('0','8'),('1','2'),..('8','7')
+    for rows, line in enumerate(lines): #('0','821*****7')
+        tokens = line.split()
+        items = tokens if len(tokens) > 1 else line
+        if len(items) != size:
+            raise ValueError("line %d of %s has %d cells, not %d" % (rows + 1, path, len(items), size))
+        for column, item in enumerate(items): #('0','8'),('1','2'),..('8','7')
             rowcol = (rows, column)
-            if item == "*":
-                board_dic[rowcol] = {1, 2, 3, 4, 5, 6, 7, 8, 9}
-            elif item.isdigit() :
-                board_dic[rowcol] = {int(item)}
-    file.close()
+            if item in BLANKS:
+                board_dic[rowcol] = set(range(1, size + 1))
+                continue
+            if item.isdigit() and len(tokens) > 1:
+                value = int(item)
+            else:
+                value = SYMBOLS.find(item.upper()) + 1 if len(item) == 1 else 0
+            if not 0 < value <= size:
+                raise ValueError("bad cell %r on line %d of %s" % (item, rows + 1, path))
+            board_dic[rowcol] = {value}
     return board_dic
     pass
 
+
+class SudokuGrid(object):
+    #the cells and constraints of one puzzle shape, built once and shared by every board of that shape.
+    #units are all-different constraints, each a list of (row, column) cells; by default the rows,
+    #columns and blocks. a unit of size cells is complete: every value appears in it exactly once.
+    #extra_units are added on top (e.g. diagonal_units for the X variant), and cages are
+    #Killer cages given as (cells, total): all-different units whose values also add up to total.
+
+    _cache = {}
+
+    def __init__(self, box_size=3, units=None, extra_units=(), cages=()):
+        size = box_size * box_size
+        self.box_size = box_size
+        self.size = size
+        self.all_values = (1 << size) - 1
+        self.cells = sudoku_cells(size)
+
+        if units is None:
+            units = sudoku_units(box_size)
+        else:
+            units = [self._indices(unit) for unit in units]
+        units = units + [self._indices(unit) for unit in extra_units]
+        self.cage_totals = {} # unit index -> total of a Killer cage
+        for cells, total in cages:
+            self.cage_totals[len(units)] = total
+            units.append(self._indices(cells))
+
+        self.units = units
+        self.complete = [len(unit) == size for unit in units]
+        self.peers = sudoku_peers(units, len(self.cells))
+        self.cell_units = sudoku_cell_units(units, len(self.cells))
+        self._arcs = None
+
+    def _indices(self, unit):
+        #unit cells may be given as (row, column) pairs or as cell indices
+        return tuple(cell if isinstance(cell, int) else cell[0] * self.size + cell[1] for cell in unit)
+
+    @classmethod
+    def get(cls, box_size=3, extra_units=()):
+        #shared grid for a box size (plus extra units), built the first time it is asked for
+        key = (box_size, tuple(tuple(unit) for unit in extra_units))
+        grid = cls._cache.get(key)
+        if grid is None:
+            grid = cls._cache[key] = cls(box_size, extra_units=extra_units)
+        return grid
+
+    @property
+    def arcs(self):
+        #(cell, peer) pairs as (row, column) tuples, built from the peer table on first use
+        if self._arcs is None:
+            cells = self.cells
+            self._arcs = [(cells[i], cells[j]) for i in range(len(cells)) for j in self.peers[i]]
+        return self._arcs
+
+
+class BoardView(MutableMapping):
+    #dict-like {(row, column): set of values} view over a Sudoku's candidate masks.
+    #reads build a fresh set; assigning a set to a cell writes its mask back to the puzzle.
+
+    def __init__(self, sudoku):
+        self.sudoku = sudoku
+
+    def __getitem__(self, cell):
+        return mask_to_values(self.sudoku.masks[self.sudoku.index(cell)])
+
+    def __setitem__(self, cell, values):
+        self.sudoku._set_mask(self.sudoku.index(cell), values_to_mask(values))
+
+    def __delitem__(self, cell):
+        raise TypeError("cells cannot be removed from a Sudoku board")
+
+    def __iter__(self):
+        return iter(self.sudoku.grid.cells)
+
+    def __len__(self):
+        return len(self.sudoku.grid.cells)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+############################################################
+# Section 1a: Propagators
+############################################################
+
+# Every propagator is called as propagator(sudoku, units) with the indices of the units
+# holding a cell whose candidates changed since the last round. It narrows the board
+# through sudoku.eliminate / sudoku.assign and returns False once it finds a contradiction.
+
+class Propagator(object):
+    #the do-nothing propagator; subclasses narrow the board
+
+    def __call__(self, sudoku, units):
+        return True
+
+    def __repr__(self):
+        return type(self).__name__ + "()"
+
+
+class HiddenSingles(Propagator):
+    #a value that only one cell of a complete unit can still hold goes in that cell
+
+    def __call__(self, sudoku, units):
+        grid = sudoku.grid
+        size = grid.size
+        places = sudoku.places
+        masks = sudoku.masks
+        for u in units:
+            if not grid.complete[u]:
+                continue
+            unit = grid.units[u]
+            base = u * size
+            for value in range(size):
+                where = places[base + value]
+                if where and where & (where - 1) == 0: # exactly one place left
+                    i = unit[where.bit_length() - 1]
+                    bit = 1 << value
+                    if masks[i] != bit and not sudoku.assign(i, bit):
+                        return False
+        return True
+
+
+class NakedSubsets(Propagator):
+    #k cells of a unit whose candidates together hold only k values (a pair, a triple, ...)
+    #use those values up, so every other cell of the unit loses them
+
+    def __init__(self, max_size=3):
+        self.max_size = max_size
+
+    def __call__(self, sudoku, units):
+        masks = sudoku.masks
+        for u in units:
+            unit = sudoku.grid.units[u]
+            open_cells = [i for i in unit if 2 <= popcount(masks[i]) <= self.max_size]
+            for size in range(2, self.max_size + 1):
+                for subset in combinations(open_cells, size):
+                    union = 0
+                    for i in subset:
+                        union |= masks[i]
+                    count = popcount(union)
+                    if count < size: # size cells sharing fewer than size values
+                        return False
+                    if count > size:
+                        continue
+                    for k in unit:
+                        if k not in subset and masks[k] & union and not sudoku.eliminate(k, union):
+                            return False
+        return True
+
+    def __repr__(self):
+        return "NakedSubsets(max_size=%d)" % self.max_size
+
+
+class LockedCandidates(Propagator):
+    #pointing and claiming: when every place a value has left in a complete unit also lies in a
+    #second unit (a block's places on one row, or a row's places inside one block), the value is
+    #taken in the second unit and the rest of that unit loses it
+
+    def __call__(self, sudoku, units):
+        grid = sudoku.grid
+        size = grid.size
+        places = sudoku.places
+        masks = sudoku.masks
+        cell_units = grid.cell_units
+        for u in units:
+            if not grid.complete[u]:
+                continue
+            unit = grid.units[u]
+            base = u * size
+            for value in range(size):
+                where = places[base + value]
+                if popcount(where) < 2:
+                    continue
+                cells = [unit[pos] for pos in bits_of(where)]
+                shared = {v for v, pos in cell_units[cells[0]]}
+                for i in cells[1:]:
+                    shared.intersection_update(v for v, pos in cell_units[i])
+                shared.discard(u)
+                bit = 1 << value
+                for v in shared:
+                    for k in grid.units[v]:
+                        if masks[k] & bit and k not in cells and not sudoku.eliminate(k, bit):
+                            return False
+        return True
+
+
+class CageSums(Propagator):
+    #Killer cages: a cell keeps only values that leave the rest of its cage able to reach the total,
+    #judged from the smallest and largest candidates left in the other cells
+
+    def __call__(self, sudoku, units):
+        grid = sudoku.grid
+        masks = sudoku.masks
+        for u in units:
+            total = grid.cage_totals.get(u)
+            if total is None:
+                continue
+            cells = grid.units[u]
+            lows = [(masks[i] & -masks[i]).bit_length() for i in cells]
+            highs = [masks[i].bit_length() for i in cells]
+            low, high = sum(lows), sum(highs)
+            if low > total or high < total:
+                return False
+            for i, cell_low, cell_high in zip(cells, lows, highs):
+                smallest = max(1, total - (high - cell_high))
+                largest = min(grid.size, total - (low - cell_low))
+                if smallest > largest:
+                    return False
+                allowed = ((1 << largest) - 1) & ~((1 << (smallest - 1)) - 1)
+                if masks[i] & ~allowed and not sudoku.eliminate(i, ~allowed):
+                    return False
+        return True
+
+
+############################################################
+# Section 1b: Sudoku board
+############################################################
+
 class Sudoku(object):
 
     CELLS = sudoku_cells() #creates a class-level constant Sudoku. More efficient.
     ARCS = sudoku_arcs() #creates a class-level constant Sudoku
+    PROPAGATORS = (HiddenSingles(), LockedCandidates(), NakedSubsets()) # used by infer_propagate and infer_with_guessing
 
-    def __init__(self, board):
+    def __init__(self, board, propagators=None, grid=None):
+        #grid is a SudokuGrid; by default the standard grid matching the size of board
+        if grid is None:
+            size = max([max(cell) + 1 for cell in board] or [9])
+            grid = SudokuGrid.get(isqrt(size))
+            if grid.size != size:
+                raise ValueError("a %dx%d board is not a square of boxes" % (size, size))
+        self.grid = grid
+        if propagators is None:
+            propagators = self.PROPAGATORS + ((CageSums(),) if grid.cage_totals else ())
+        self.propagators = tuple(propagators)
+        self.trail = None # (cell index, previous mask) for every change made while infer_with_guessing is searching
+        self.nodes = 0 # search nodes visited by infer_with_guessing
+        self.backtracks = 0 # guesses that were undone
+        self.propagations = 0 # solved cells pushed out to their peers
         self.board = board
         pass
 
+    @property
+    def size(self):
+        return self.grid.size
+
+    @property
+    def board(self):
+        return BoardView(self)
+
+    @board.setter
+    def board(self, board):
+        #cells missing from the dictionary start out unconstrained
+        grid = self.grid
+        size = grid.size
+        masks = [grid.all_values] * len(grid.cells)
+        for cell, values in board.items():
+            masks[self.index(cell)] = values_to_mask(values) & grid.all_values
+        self.masks = masks
+
+        # places[u * size + v]: bitmask of the positions in unit u where value v + 1 can still go;
+        # its popcount is the number of such cells
+        places = [0] * (len(grid.units) * size)
+        for u, unit in enumerate(grid.units):
+            base = u * size
+            for pos, i in enumerate(unit):
+                for value in bits_of(masks[i]):
+                    places[base + value] |= 1 << pos
+        self.places = places
+        self.conflict = not all(masks) or any(
+            complete and not places[u * size + value]
+            for u, complete in enumerate(grid.complete) for value in range(size))
+        self._reset_queues()
+
+    def _reset_queues(self):
+        #treat every solved cell as freshly solved and every cell as changed
+        self.singles = deque(i for i, mask in enumerate(self.masks) if is_single(mask))
+        self.changed = set(range(len(self.masks)))
+
+    def index(self, cell):
+        #(row, column) -> position in the mask array
+        return cell[0] * self.grid.size + cell[1]
+
     def get_values(self, cell):
-        return self.board[cell]
+        return mask_to_values(self.masks[self.index(cell)])
         pass
 
+    def _set_mask(self, i, mask):
+        # the one place cell masks change: records the old mask on the trail, keeps the
+        # per-unit places in step, and queues the cell for the propagators.
+        # returns False when the change leaves a cell or a unit value with nowhere to go.
+        old = self.masks[i]
+        if old == mask:
+            return not self.conflict
+        if self.trail is not None:
+            self.trail.append((i, old))
+        self.masks[i] = mask
+        self._move_places(i, old, mask)
+        self.changed.add(i)
+        if mask == 0:
+            self.conflict = True
+        elif mask & (mask - 1) == 0:
+            self.singles.append(i)
+        return not self.conflict
+
+    def _move_places(self, i, old, new):
+        grid = self.grid
+        size = grid.size
+        places = self.places
+        removed = bits_of(old & ~new)
+        added = bits_of(new & ~old)
+        for u, pos in grid.cell_units[i]:
+            base = u * size
+            bit = 1 << pos
+            for value in removed:
+                places[base + value] &= ~bit
+                if not places[base + value] and grid.complete[u]:
+                    self.conflict = True
+            for value in added:
+                places[base + value] |= bit
+
+    def eliminate(self, i, mask):
+        #removes the values in mask from cell i
+        return self._set_mask(i, self.masks[i] & ~mask)
+
+    def assign(self, i, bit):
+        #narrows cell i down to the single value bit
+        if not self.masks[i] & bit:
+            self.conflict = True
+            return False
+        return self._set_mask(i, bit)
+
     def remove_inconsistent_values(self, cell1, cell2):
         #removes any value in the set of possibilities
         # for cell1 for which there are no values in the set of possibilities for cell2
-        board = self.board
-        set1 = board[cell1]
-        set2 = board[cell2]
-
-        if len(set2) == 1:
-            val = list(set2)[0]
-            if val in set1:
-                new_set = set()
-                set1_li = list(set1)
-                for x in set1_li: ## for values in list of set 1, if it's also in set2 it should continue, or else add it to a new set.
-                    if x == val:
-                        continue
-                    new_set.add(x)
-                board[cell1] = new_set
-                return True #If any values were removed, return True
-        else: # else, return False .
-            return False
+        masks = self.masks
+        i = self.index(cell1)
+        mask2 = masks[self.index(cell2)]
+
+        if is_single(mask2) and masks[i] & mask2:
+            self.eliminate(i, mask2)
+            return True #If any values were removed, return True
+        return False
         pass
 
-    def adjacent(self, cell, j={}):
-        return [k for k, i in self.ARCS if (i == cell and not j == k)]
+    def adjacent(self, cell, j=None):
+        #cells k with an arc (k, cell), leaving out j
+        cells = self.grid.cells
+        return [cells[k] for k in self.grid.peers[self.index(cell)] if cells[k] != j]
 
     def finished(self):
-        for cell in self.CELLS:
-            if len(self.board[cell]) != 1:
+        for mask in self.masks:
+            if not is_single(mask):
                 return False
         return True
 
+    def _propagate_singles(self):
+        # an arc (k, i) only removes anything once cell i is down to a single value,
+        # so the queue holds solved cells and each one is pushed out to its peers.
+        masks = self.masks
+        peers = self.grid.peers
+        singles = self.singles
+        while singles:
+            if self.conflict:
+                return False
+            i = singles.popleft()
+            bit = masks[i]
+            self.propagations += 1
+            for k in peers[i]:
+                if masks[k] & bit and not self._set_mask(k, masks[k] & ~bit):
+                    return False
+        return not self.conflict
+
+    def propagate(self, propagators=None):
+        # runs naked singles and the given propagators (self.propagators by default) until
+        # nothing changes. each round the propagators only see the units around cells that
+        # changed since the round before. returns False on a contradiction.
+        if propagators is None:
+            propagators = self.propagators
+        cell_units = self.grid.cell_units
+        while True:
+            if not self._propagate_singles():
+                return False
+            if not self.changed or not propagators:
+                return True
+            units = set()
+            for i in self.changed:
+                units.update(u for u, pos in cell_units[i])
+            self.changed = set()
+            for propagator in propagators:
+                if not propagator(self, units) or not self._propagate_singles():
+                    return False
+
 
     def infer_ac3(self):#narrow down each cell's set of values as much as possible
-        queues = Queue()
-        for arcs in self.ARCS:
-            queues.put(arcs)
-
-        while not queues.empty():
-            (cell1, cell2) = queues.get()
-            if self.remove_inconsistent_values(cell1, cell2):
-                for k in self.adjacent(cell1, cell2):
-                    queues.put((k, cell1))
-        pass
+        # returns False as soon as some cell runs out of values.
+        self._reset_queues()
+        return self._propagate_singles()
 
 
     def infer_improved(self):# 7 appears after the improved in the example.
         #improved version of infer_ac3 - use loop
-        pin = True
-        while pin:
-            self.infer_ac3()
-            pin = False
-            for cell in Sudoku.CELLS:
-                temp_set = self.board[cell]
-
-                if (len(temp_set) > 1):
-                    for val in temp_set:
-                        test_col = [self.board[(i, cell[1])] for i in range(9) if (i, cell[1]) != cell]
-                        test_row = [self.board[(cell[0], i)] for i in range(9) if (cell[0], i) != cell]
-                        test_block = []
-
-                        for i in range(9):
-                            for j in range(9):
-                                if (i, j) != cell and (i // 3 == cell[0] // 3) and (j // 3 == cell[1] // 3):
-                                    test_block.append(self.board[(i, j)])
-
-                        column = {values for sets in test_col for values in sets}
-                        row = {values for sets in test_row for values in sets}
-                        block = {values for sets in test_block for values in sets}
-
-                        if (val not in column) or (val not in row) or (val not in block):
-                            self.board[cell] = {val}
-                            pin = True
-                            continue
-        pass
+        # a value that no other cell of a row, column or block can hold has to go in this cell.
+        # returns False when the board turns out to be contradictory.
+        self._reset_queues()
+        return self.propagate([HiddenSingles()] + [p for p in self.propagators if isinstance(p, CageSums)])
+
+    def infer_propagate(self):
+        # infer_improved plus the rest of self.propagators (pointing/claiming, naked pairs and triples)
+        self._reset_queues()
+        return self.propagate()
 
     def infer_with_guessing(self):
-        #call infer_improved
-        self.infer_improved()
-
-        for cell in Sudoku.CELLS:
-            temp_set = self.board[cell]
-            if len(temp_set) > 1:
-                guess_board = deepcopy(self.board)
-
-                for val in temp_set:
-                    self.board[cell] = {val}
-                    self.infer_with_guessing()
-                    if self.finished():
+        # depth-first search on top of self.propagators. changes are recorded on self.trail and
+        # rolled back on failure instead of copying the board, the cell with the fewest values
+        # left is branched on first, and a branch is dropped as soon as inference hits a contradiction.
+        # returns True when the board was solved.
+        self.nodes = self.backtracks = self.propagations = 0
+        self.trail = []
+        self._reset_queues()
+        try:
+            return self._search()
+        finally:
+            self.trail = None
+
+    def _search(self):
+        self.nodes += 1
+        if not self.propagate():
+            return False
+        i = self._most_constrained()
+        if i is None:
+            return True
+
+        masks = self.masks
+        mask = masks[i]
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            mark = len(self.trail)
+            if self.assign(i, bit) and self._search():
+                return True
+            self._undo(mark)
+            self.backtracks += 1
+        return False
+
+    def _most_constrained(self):
+        #index of an unsolved cell with the fewest values left (minimum remaining values), or None when all are solved
+        best = None
+        best_count = self.grid.size + 1
+        for i, mask in enumerate(self.masks):
+            if mask & (mask - 1):
+                count = popcount(mask)
+                if count < best_count:
+                    best, best_count = i, count
+                    if count == 2:
                         break
-                    else:
-                        self.board = guess_board
-        pass
+        return best
+
+    def _undo(self, mark):
+        #rolls the board back to the point where the trail was mark entries long.
+        #the board was at a fixpoint there, so nothing is left to propagate.
+        masks = self.masks
+        trail = self.trail
+        while len(trail) > mark:
+            i, mask = trail.pop()
+            self._move_places(i, masks[i], mask)
+            masks[i] = mask
+        self.conflict = False
+        self.singles.clear()
+        self.changed = set()
+
+
+    def exact_cover(self):
+        # the board as an ExactCover problem: a row for each value still possible in each cell, and a column
+        # for each cell and for each (unit, value). cell columns and those of complete units must be covered
+        # exactly once (4 * 81 = 324 of them for the classic puzzle); those of smaller units (cages, short
+        # extra units) at most once. rows are named (cell index, value bit).
+        # a Killer cage also gets a column of its own, covered by one row per set of values adding up to its
+        # total; that row takes the cage's (unit, value) columns for the values outside the set, so the cells
+        # are left with exactly the set. those rows are named (None, unit).
+        grid = self.grid
+        size = grid.size
+        cell_count = len(grid.cells)
+        cages = sorted(grid.cage_totals)
+        primary = [u for u, complete in enumerate(grid.complete) if complete]
+        secondary = [u for u, complete in enumerate(grid.complete) if not complete]
+        base = {}
+        for k, u in enumerate(primary + secondary):
+            base[u] = cell_count + len(cages) + k * size
+        problem = ExactCover(cell_count + len(cages) + len(primary) * size, len(secondary) * size)
+        for i, mask in enumerate(self.masks):
+            for value in bits_of(mask):
+                problem.add_row([i] + [base[u] + value for u, pos in grid.cell_units[i]], (i, 1 << value))
+        for k, u in enumerate(cages):
+            unit = grid.units[u]
+            possible = 0
+            for i in unit:
+                possible |= self.masks[i]
+            for values in combinations(bits_of(possible), len(unit)):
+                if sum(values) + len(values) == grid.cage_totals[u]:
+                    problem.add_row([cell_count + k] + [base[u] + value for value in range(size)
+                                                        if value not in values], (None, u))
+        return problem
+
+    def iter_solutions(self):
+        # every solution of the board as it stands (givens plus whatever inference has removed), as a
+        # {(row, column): {value}} dictionary, found by exact_cover's dancing links
+        if self.conflict:
+            return
+        cells = self.grid.cells
+        for rows in self.exact_cover().solutions():
+            masks = [0] * len(cells)
+            for i, bit in rows:
+                if i is not None:
+                    masks[i] = bit
+            yield dict((cells[i], {mask.bit_length()}) for i, mask in enumerate(masks))
+
+    def count_solutions(self, limit=None):
+        # number of solutions, counting stops at limit; count_solutions(2) == 1 checks a puzzle is unique
+        count = 0
+        for solution in self.iter_solutions():
+            count += 1
+            if count == limit:
+                break
+        return count
+
+    def infer_exact_cover(self):
+        # solves the board with the exact-cover backend instead of infer_with_guessing's search.
+        # returns True, with the first solution on the board, when there is one.
+        for solution in self.iter_solutions():
+            self.board = solution
+            return True
+        return False
+
+
+############################################################
+# Section 1c: Exact cover
+############################################################
+
+class ExactCover(object):
+    #Knuth's Algorithm X with dancing links. columns 0 .. primary - 1 must each be covered by exactly one
+    #chosen row, the secondary columns after them by at most one. every node sits in two circular
+    #doubly linked lists, its row and its column, kept as parallel arrays (index 0 is the root, 1 .. n
+    #the column headers); covering a column unlinks it and the rows through it and uncovering relinks them
+    #in reverse order, so backtracking costs no copying.
+
+    def __init__(self, primary, secondary=0):
+        columns = primary + secondary
+        headers = range(columns + 1)
+        self.left = [c - 1 for c in headers]
+        self.right = [c + 1 for c in headers]
+        self.left[0] = primary
+        self.right[primary] = 0
+        for c in range(primary + 1, columns + 1):
+            self.left[c] = self.right[c] = c # secondary headers stay off the root's list
+        self.up = list(headers)
+        self.down = list(headers)
+        self.column = list(headers)
+        self.sizes = [0] * (columns + 1)
+        self.row_of = [None] * (columns + 1)
+        self.names = []
+
+    def add_row(self, columns, name=None):
+        #a row covering the given columns; solutions list rows by name (default: their number)
+        left, right, up, down = self.left, self.right, self.up, self.down
+        row = len(self.names)
+        self.names.append(row if name is None else name)
+        first = None
+        for c in columns:
+            c += 1
+            node = len(self.column)
+            self.column.append(c)
+            self.row_of.append(row)
+            up.append(up[c])
+            down.append(c)
+            down[up[c]] = node
+            up[c] = node
+            self.sizes[c] += 1
+            if first is None:
+                first = node
+                left.append(node)
+                right.append(node)
+            else:
+                left.append(left[first])
+                right.append(first)
+                right[left[first]] = node
+                left[first] = node
+        return row
+
+    def _cover(self, c):
+        left, right, up, down, column, sizes = self.left, self.right, self.up, self.down, self.column, self.sizes
+        right[left[c]] = right[c]
+        left[right[c]] = left[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                sizes[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def _uncover(self, c):
+        left, right, up, down, column, sizes = self.left, self.right, self.up, self.down, self.column, self.sizes
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                sizes[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[c]] = c
+        left[right[c]] = c
+
+    def solutions(self):
+        #yields each exact cover as a list of row names, lazily; the search branches on the primary
+        #column with the fewest rows left and keeps an explicit stack instead of recursing
+        right, left, down, column, sizes = self.right, self.left, self.down, self.column, self.sizes
+        stack = [] # [column, row node being tried] per level, the node is the column header before the first try
+        while True:
+            if right[0] == 0:
+                yield [self.names[self.row_of[node]] for c, node in stack]
+            else:
+                best = c = right[0]
+                while c:
+                    if sizes[c] < sizes[best]:
+                        best = c
+                    if sizes[best] < 2:
+                        break
+                    c = right[c]
+                self._cover(best)
+                stack.append([best, best])
+
+            while stack:
+                c, node = stack[-1]
+                if node != c:
+                    j = left[node]
+                    while j != node:
+                        self._uncover(column[j])
+                        j = left[j]
+                node = down[node]
+                if node != c:
+                    stack[-1][1] = node
+                    j = right[node]
+                    while j != node:
+                        self._cover(column[j])
+                        j = right[j]
+                    break
+                self._uncover(c)
+                stack.pop()
+            else:
+                return
+
+
+############################################################
+# Section 2: Batch solving
+############################################################
+
+# one solved (or abandoned) puzzle from solve_batch.
+# puzzle/solution are one-line strings of size * size symbols, "." marking cells left open.
+SolveResult = namedtuple("SolveResult", ["index", "puzzle", "solution", "solved", "seconds", "nodes"])
+
+def board_from_string(line):
+    #size * size symbols, row by row ("1".."9", then "A".. for 10 and up); ".", "0" or "*" is a blank cell
+    line = line.strip()
+    size = isqrt(len(line))
+    if size * size != len(line) or isqrt(size) ** 2 != size:
+        raise ValueError("%d cells do not make a square grid of boxes: %r" % (len(line), line))
+    board = {}
+    for i, item in enumerate(line):
+        cell = (i // size, i % size)
+        if item in BLANKS:
+            board[cell] = set(range(1, size + 1))
+        else:
+            value = SYMBOLS.find(item.upper()) + 1
+            if not 0 < value <= size:
+                raise ValueError("bad cell %r in %r" % (item, line))
+            board[cell] = {value}
+    return board
+
+def board_to_string(board):
+    #inverse of board_from_string; cells that are not down to one value become "."
+    size = isqrt(len(board))
+    cells = []
+    for cell in sudoku_cells(size):
+        values = board[cell]
+        cells.append(SYMBOLS[min(values) - 1] if len(values) == 1 else ".")
+    return "".join(cells)
+
+def iter_puzzles(path):
+    #lazily reads a one-puzzle-per-line file; blank lines and "#" comments are skipped
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+def is_valid_solution(sudoku):
+    #every cell solved, every complete unit holding all the values, every other unit
+    #holding distinct values and every cage adding up to its total
+    if not sudoku.finished():
+        return False
+    grid = sudoku.grid
+    masks = sudoku.masks
+    for u, unit in enumerate(grid.units):
+        seen = 0
+        for i in unit:
+            seen |= masks[i]
+        if popcount(seen) != len(unit):
+            return False
+        if u in grid.cage_totals and sum(masks[i].bit_length() for i in unit) != grid.cage_totals[u]:
+            return False
+    return True
+
+def solve_puzzle(puzzle, index=0):
+    #solves one one-line puzzle and reports how long it took and how many search nodes it needed
+    start = time.perf_counter()
+    sudoku = Sudoku(board_from_string(puzzle))
+    sudoku.infer_with_guessing()
+    seconds = time.perf_counter() - start
+    return SolveResult(index, puzzle, board_to_string(sudoku.board), is_valid_solution(sudoku), seconds, sudoku.nodes)
+
+def _solve_chunk(chunk):
+    #worker entry point: chunk is a list of (index, puzzle) pairs
+    return [solve_puzzle(puzzle, index) for index, puzzle in chunk]
+
+def _chunks(puzzles, chunksize):
+    #groups the (index, one-line puzzle) stream into lists without reading ahead further than one chunk
+    numbered = ((index, puzzle if isinstance(puzzle, str) else board_to_string(puzzle))
+                for index, puzzle in enumerate(puzzles))
+    while True:
+        chunk = list(islice(numbered, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def solve_batch(puzzles, workers=None, chunksize=64, ordered=True, max_pending=None):
+    #solves many puzzles across a process pool and yields a SolveResult per puzzle as a stream.
+    #puzzles is either the path of a one-puzzle-per-line file or an iterable of boards
+    #(read_board-style dictionaries or one-line strings, 81 characters for a 9x9 puzzle).
+    #ordered=True yields in input order, otherwise results come out as their chunk finishes.
+    #at most max_pending chunks (default 2 per worker) are in flight, so memory does not grow with the input.
+    if isinstance(puzzles, str):
+        puzzles = iter_puzzles(puzzles)
+    chunks = _chunks(puzzles, chunksize)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for chunk in chunks:
+            for result in _solve_chunk(chunk):
+                yield result
+        return
+
+    if max_pending is None:
+        max_pending = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(_solve_chunk, chunk) for chunk in islice(chunks, max_pending))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                done = [future for future in pending if future in finished]
+                for future in done:
+                    pending.remove(future)
+
+            for future in done:
+                for chunk in islice(chunks, 1):
+                    pending.append(executor.submit(_solve_chunk, chunk))
+                for result in future.result():
+                    yield result
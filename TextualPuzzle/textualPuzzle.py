@@ -1,20 +1,66 @@
+############################################################
+# Imports
+############################################################
+import heapq
+import weakref
+
+
 ############################################################
 # Section 1: Propositional Logic
 ############################################################
 
 class Expr(object):
-    def __hash__(self):
+    # expressions are hash-consed: building an expression structurally equal to one that is still alive
+    # returns that same object, so equality is identity and the hash is computed once, at construction.
+    # each subclass gives _key(*args), the structure it is interned by, and _init(*args), which sets its fields.
+    # copies are the expression itself and pickles rebuild it from its constructor arguments, so that an
+    # unpickled expression is interned (and hashed) like any other.
+    _table = weakref.WeakValueDictionary()
+
+    def __new__(cls, *args):
+        key = (cls, cls._key(*args))
+        expr = Expr._table.get(key)
+        if expr is None:
+            expr = object.__new__(cls)
+            expr._init(*args)
+            expr._args = args
+            expr._hash = expr._structure_hash()
+            Expr._table[key] = expr
+        return expr
+
+    def __reduce__(self):
+        return (type(self), self._args)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _structure_hash(self):
         return hash((type(self).__name__, self.hashable))
 
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return not self == other
+
 class Atom(Expr):
-    def __init__(self, name):
+    @staticmethod
+    def _key(name):
+        return name
+    def _init(self, name):
         self.name = name
         self.hashable = name
     def __hash__(self):
         return Expr.__hash__(self)
     def __eq__(self, other):
         # two expressions should be considered equal only if they are of the same class and have       the same internal structure
-        return self.name == other.name and type(self) == type(other)
+        return self is other
         pass
 
     def __repr__(self):
@@ -29,19 +75,34 @@ class Atom(Expr):
         return assignment[self.name] #TRUE else FALSE
         pass
 
+    def partial_evaluate(self, assignment):
+        # like evaluate, with atoms missing from the assignment unknown: True or False when every completion
+        # of the assignment agrees on it, else None
+        return assignment.get(self.name)
+
     def to_cnf(self):
         return self
         pass
 
+    def clauses(self, atoms, positive=True):
+        literal = atoms.id(self.name)
+        return {frozenset([literal if positive else -literal])}
+
+    def define(self, atoms):
+        return atoms.id(self.name)
+
 
 class Not(Expr):
-    def __init__(self, arg):
+    @staticmethod
+    def _key(arg):
+        return arg
+    def _init(self, arg):
         self.arg = arg
         self.hashable = arg
     def __hash__(self):
         return Expr.__hash__(self)
     def __eq__(self, other):
-        return self.arg == other.arg and type(self) == type(other)
+        return self is other
         pass
 
     def __repr__(self):
@@ -56,6 +117,10 @@ class Not(Expr):
         return not self.arg.evaluate(assignment) #if assignment FALSE, then return TRUE
         pass
 
+    def partial_evaluate(self, assignment):
+        value = self.arg.partial_evaluate(assignment)
+        return None if value is None else not value
+
     def to_cnf(self):
         # output of this method should be a literal (i.e. an atom or a negated atom), a disjunction of literals, or a conjunction consisting of literals and/or disjunctions of literals.
         var = self.arg.to_cnf()
@@ -65,19 +130,28 @@ class Not(Expr):
         if type(var) == Not:
             return var.arg
         if type(var) == And:  # DeMorgans law 1)  not (a and b) = (not a) or (not b)
-            return Or(*map(Not, var.hashable))
+            return Or(*map(Not, var.hashable)).to_cnf()
         if type(var) == Or:  # DeMorgans law 2)  (not (a or b)) = (not a) and (not b)
-            return And(*map(Not, var.hashable))
+            return And(*map(Not, var.hashable)).to_cnf()
         pass
-        
+
+    def clauses(self, atoms, positive=True):
+        return atoms.clauses(self.arg, not positive)
+
+    def define(self, atoms):
+        return -atoms.literal(self.arg)
+
 class And(Expr):
-    def __init__(self, *conjuncts):
+    @staticmethod
+    def _key(*conjuncts):
+        return frozenset(conjuncts)
+    def _init(self, *conjuncts):
         self.conjuncts = frozenset(conjuncts)
         self.hashable = self.conjuncts
     def __hash__(self):
         return Expr.__hash__(self)
     def __eq__(self, other):
-        return self.conjuncts == other.conjuncts
+        return self is other
         pass
 
     def __repr__(self):
@@ -97,6 +171,16 @@ class And(Expr):
         else: return True
         pass
 
+    def partial_evaluate(self, assignment):
+        result = True
+        for x in self.hashable:
+            value = x.partial_evaluate(assignment)
+            if value == False:
+                return False
+            if value is None:
+                result = None
+        return result
+
     def to_cnf(self):
         temp = []
         conj = [x.to_cnf() for x in self.hashable]
@@ -112,14 +196,34 @@ class And(Expr):
         return result
         pass
 
+    def clauses(self, atoms, positive=True):
+        # a conjunction is the union of its conjuncts' clauses; its negation distributes their negations
+        if positive:
+            return set().union(*[atoms.clauses(x) for x in self.hashable])
+        return clause_product([atoms.clauses(x, False) for x in self.hashable])
+
+    def define(self, atoms):
+        # x <-> And(c1, ..., cn): (Not(x) or ci) for each i, and (x or Not(c1) or ... or Not(cn))
+        literals = [atoms.literal(x) for x in self.hashable]
+        if len(literals) == 1:
+            return literals[0]
+        x = atoms.aux()
+        for literal in literals:
+            atoms.add_definition([-x, literal])
+        atoms.add_definition([x] + [-literal for literal in literals])
+        return x
+
 class Or(Expr):
-    def __init__(self, *disjuncts):
+    @staticmethod
+    def _key(*disjuncts):
+        return frozenset(disjuncts)
+    def _init(self, *disjuncts):
         self.disjuncts = frozenset(disjuncts)
         self.hashable = self.disjuncts
     def __hash__(self):
         return Expr.__hash__(self)
     def __eq__(self, other):
-        return self.disjuncts == other.disjuncts
+        return self is other
         pass
 
     def __repr__(self):
@@ -137,6 +241,16 @@ class Or(Expr):
         else: return False
         pass
 
+    def partial_evaluate(self, assignment):
+        result = False
+        for x in self.hashable:
+            value = x.partial_evaluate(assignment)
+            if value:
+                return True
+            if value is None:
+                result = None
+        return result
+
     def to_cnf(self):
         temp = []
         conj = [x.to_cnf() for x in self.hashable]
@@ -162,15 +276,35 @@ class Or(Expr):
         return result
         pass
 
+    def clauses(self, atoms, positive=True):
+        # a disjunction distributes over its disjuncts' clauses; its negation is the union of theirs
+        if positive:
+            return clause_product([atoms.clauses(x) for x in self.hashable])
+        return set().union(*[atoms.clauses(x, False) for x in self.hashable])
+
+    def define(self, atoms):
+        # x <-> Or(d1, ..., dn): (x or Not(di)) for each i, and (Not(x) or d1 or ... or dn)
+        literals = [atoms.literal(x) for x in self.hashable]
+        if len(literals) == 1:
+            return literals[0]
+        x = atoms.aux()
+        for literal in literals:
+            atoms.add_definition([x, -literal])
+        atoms.add_definition([-x] + literals)
+        return x
+
 class Implies(Expr):
-    def __init__(self, left, right):
+    @staticmethod
+    def _key(left, right):
+        return (left, right)
+    def _init(self, left, right):
         self.left = left
         self.right = right
         self.hashable = (left, right)
     def __hash__(self):
         return Expr.__hash__(self)
     def __eq__(self, other):
-        return self.hashable == other.hashable
+        return self is other
         pass
 
     def __repr__(self):
@@ -185,19 +319,49 @@ class Implies(Expr):
         return not self.left.evaluate(assignment) or self.right.evaluate(assignment)
         pass
 
+    def partial_evaluate(self, assignment):
+        left = self.left.partial_evaluate(assignment)
+        if left == False:
+            return True
+        right = self.right.partial_evaluate(assignment)
+        if right:
+            return True
+        return None if left is None or right is None else False
+
     def to_cnf(self):
         return Or(Not(self.left), self.right).to_cnf()
         pass
 
+    def clauses(self, atoms, positive=True):
+        # Or(Not(left), right), or And(left, Not(right)) when negated
+        if positive:
+            return clause_product([atoms.clauses(self.left, False), atoms.clauses(self.right)])
+        return atoms.clauses(self.left) | atoms.clauses(self.right, False)
+
+    def define(self, atoms):
+        # x <-> Or(Not(left), right)
+        left, right = atoms.literal(self.left), atoms.literal(self.right)
+        x = atoms.aux()
+        atoms.add_definition([-x, -left, right])
+        atoms.add_definition([x, left])
+        atoms.add_definition([x, -right])
+        return x
+
 class Iff(Expr):
-    def __init__(self, left, right):
+    @staticmethod
+    def _key(left, right):
+        return (left, right)
+    def _init(self, left, right):
         self.left = left
         self.right = right
         self.hashable = (left, right)
+    def _structure_hash(self):
+        # Iff(a, b) == Iff(b, a), so the hash must not depend on the order
+        return hash((type(self).__name__, frozenset(self.hashable)))
     def __hash__(self):
         return Expr.__hash__(self)
     def __eq__(self, other):
-        return self.hashable == other.hashable or other.hashable == (self.right, self.left)
+        return self is other or (type(other) == Iff and other.hashable == (self.right, self.left))
         pass
 
     def __repr__(self):
@@ -212,40 +376,726 @@ class Iff(Expr):
         return Implies(self.left, self.right).evaluate(assignment) and Implies(self.right, self.left).evaluate(assignment)
         pass
 
+    def partial_evaluate(self, assignment):
+        left = self.left.partial_evaluate(assignment)
+        right = self.right.partial_evaluate(assignment)
+        return None if left is None or right is None else left == right
+
     def to_cnf(self):
         # Or(And(a,Not(b)),And(Not(a),b)) === And(Or(a,b), Or(Not(a),Not(b))
         return And(Implies(self.left, self.right), Implies(self.right, self.left)).to_cnf()
         pass
 
-def satisfying_assignments(expr):
+    def clauses(self, atoms, positive=True):
+        # And(Or(Not(a), b), Or(a, Not(b))), or And(Or(a, b), Or(Not(a), Not(b))) when negated
+        left, right = self.left, self.right
+        return (clause_product([atoms.clauses(left, not positive), atoms.clauses(right)]) |
+                clause_product([atoms.clauses(left, positive), atoms.clauses(right, False)]))
+
+    def define(self, atoms):
+        # x <-> Iff(left, right)
+        left, right = atoms.literal(self.left), atoms.literal(self.right)
+        x = atoms.aux()
+        atoms.add_definition([-x, -left, right])
+        atoms.add_definition([-x, left, -right])
+        atoms.add_definition([x, left, right])
+        atoms.add_definition([x, -left, -right])
+        return x
+
+def satisfying_assignments(expr, cubes=False):
     # generates all assignments from atom names to  truth values
     # out of 2 to the power of n atoms, only expressions that makes it TRUE.
-    # combination + permutation
-    atoms = list(expr.atom_names())
-    states = [True, False]
-    comb = itertools.product(states, repeat=len(atoms))
-    possible_dict = [{key: val for (key, val) in zip(atoms, ele)} for ele in comb]
-
-    # check if TRUE
-    for i in possible_dict:
-        if expr.evaluate(i):
-            yield i
+    # the models are found one at a time by a Solver over the Tseitin clauses of expr, each one blocked by a
+    # clause before asking for the next, so taking the first few costs a few searches whatever the number
+    # of atoms. with cubes=True each model is first shrunk to a partial assignment that makes expr true
+    # whichever way the atoms it leaves out go (partial_evaluate), and that stays disjoint from the cubes
+    # already yielded; the cubes then cover every model exactly once, a cube of k atoms standing for
+    # 2 ** (n - k) of them.
+    atoms = AtomTable()
+    solver = Solver()
+    for clause in list(atoms.tseitin_clauses(expr)) + atoms.take_definitions():
+        solver.add_clause(clause)
+    names = sorted(expr.atom_names())
+    ids = [atoms.id(name) for name in names]
+    for atom in ids:
+        solver.ensure_atom(atom)
+    found = []
+
+    while solver.solve():
+        assignment = dict((name, solver.model[atom]) for name, atom in zip(names, ids))
+        if cubes:
+            assignment = shrink_cube(expr, assignment, found)
+            found.append(assignment)
+        blocking = [-atoms.id(name) if value else atoms.id(name) for name, value in assignment.items()]
+        yield dict(assignment)
+        if not solver.add_clause(blocking):
+            return
     pass
 
+def shrink_cube(expr, assignment, cubes):
+    # a subset of the model assignment that still makes expr true under partial_evaluate and still
+    # disagrees with each of cubes on some atom; atoms are left out greedily in name order
+    cube = dict(assignment)
+    disagreements = [sum(1 for name, value in other.items() if cube[name] != value) for other in cubes]
+    for name in sorted(assignment):
+        value = cube.pop(name)
+        touched = [i for i, other in enumerate(cubes) if name in other and other[name] != value]
+        if any(disagreements[i] == 1 for i in touched) or not expr.partial_evaluate(cube):
+            cube[name] = value
+            continue
+        for i in touched:
+            disagreements[i] -= 1
+    return cube
+
+def count_models(expr):
+    # the number of assignments to the atoms of expr that make it true, without enumerating them. every
+    # assignment extends to exactly one model of the Tseitin clauses of expr, so those are counted instead,
+    # by count_clauses
+    atoms = AtomTable()
+    clauses = set(atoms.tseitin_clauses(expr)) | set(atoms.take_definitions())
+    variables = set(abs(literal) for clause in clauses for literal in clause)
+    variables.update(atoms.id(name) for name in expr.atom_names())
+    return count_clauses(clauses, variables)
+
+def count_clauses(clauses, variables):
+    # the number of assignments to variables (atom ids, a superset of the clauses' atoms) satisfying every
+    # clause, by a ModelCounter (Section 1b)
+    counter = ModelCounter()
+    for clause in clauses:
+        if not counter.add_clause(clause):
+            return 0
+    return counter.count(variables)
+
+
+############################################################
+# Section 1a: Clause Form
+############################################################
+
+# a literal is a nonzero integer: +id for an atom, -id for its negation. a clause is a frozenset of literals
+# (their disjunction; the empty clause is false) and a CNF is a set of clauses (their conjunction).
+
+def is_tautology(clause):
+    return any(-literal in clause for literal in clause)
+
+def clause_product(cnfs):
+    # the CNF of the disjunction of the given CNFs: one clause for each way of picking a clause from each,
+    # leaving out tautologies; duplicates fall away in the set
+    result = {frozenset()}
+    for cnf in cnfs:
+        result = set(a | b for a in result for b in cnf if not is_tautology(a | b))
+    return result
+
+BOUND_CAP = 1 << 32  # see AtomTable.clause_bound
+
+class AtomTable(object):
+    # atom name <-> integer id, and each expression's clauses under those ids, computed once per expression
+    # (and polarity) for the life of the table.
+    #
+    # it also gives the Tseitin encoding: literal(expr) is a literal equivalent to expr, a fresh auxiliary
+    # atom x for each compound subexpression, defined by clauses stating x <-> (that subexpression over its
+    # children's literals). the clauses grow linearly with the expression where the exact CNF of clauses()
+    # can grow exponentially, and they are equisatisfiable with it rather than equivalent. each definition
+    # is a full bi-implication, so it constrains nothing but its own auxiliary atom and can stay in a
+    # knowledge base for good; it is made once per subexpression, and new ones collect in definitions
+    # until take_definitions().
+
+    def __init__(self):
+        self.ids = {}
+        self.names = [None]  # ids start at 1 so that -id is a different literal
+        self._clauses = {}
+        self._bounds = {}
+        self._literals = {}
+        self.definitions = []
+
+    def id(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def literal_expr(self, literal):
+        atom = Atom(self.names[abs(literal)])
+        return atom if literal > 0 else Not(atom)
+
+    def clause_expr(self, clause):
+        # the clause as an Expr: a literal, or the Or of its literals
+        literals = [self.literal_expr(literal) for literal in sorted(clause, key=abs)]
+        return literals[0] if len(literals) == 1 else Or(*literals)
+
+    def clauses(self, expr, positive=True):
+        # the CNF of expr (of Not(expr) when positive is False) as a frozenset of clauses
+        key = (expr, positive)
+        if key not in self._clauses:
+            self._clauses[key] = frozenset(expr.clauses(self, positive))
+        return self._clauses[key]
+
+    def clause_bound(self, expr, positive=True):
+        # an upper bound on len(clauses(expr, positive)) that does not compute the clauses: the product of
+        # the operands' bounds where clauses() distributes and their sum where it takes a union, capped at
+        # BOUND_CAP so that deep nests of Iffs stay small numbers
+        key = (expr, positive)
+        if key in self._clauses:
+            return len(self._clauses[key])
+        if key not in self._bounds:
+            kind = type(expr)
+            bound = self.clause_bound
+            if kind == Atom:
+                count = 1
+            elif kind == Not:
+                count = bound(expr.arg, not positive)
+            elif (kind == And and positive) or (kind == Or and not positive):
+                count = sum(bound(x, positive) for x in expr.hashable)
+            elif kind == And or kind == Or:
+                count = 1
+                for x in expr.hashable:
+                    count = min(count * bound(x, positive), BOUND_CAP)
+            elif kind == Implies:
+                if positive:
+                    count = bound(expr.left, False) * bound(expr.right)
+                else:
+                    count = bound(expr.left) + bound(expr.right, False)
+            else:
+                count = (bound(expr.left, not positive) * bound(expr.right) +
+                         bound(expr.left, positive) * bound(expr.right, False))
+            self._bounds[key] = min(count, BOUND_CAP)
+        return self._bounds[key]
+
+    def aux(self):
+        # a fresh auxiliary atom; its name cannot be a user atom's, as it is not entered in ids
+        self.names.append("#%d" % len(self.names))
+        return len(self.names) - 1
+
+    def add_definition(self, literals):
+        clause = frozenset(literals)
+        if not is_tautology(clause):
+            self.definitions.append(clause)
+
+    def take_definitions(self):
+        definitions, self.definitions = self.definitions, []
+        return definitions
+
+    def literal(self, expr):
+        # the Tseitin literal of expr, see above
+        if expr not in self._literals:
+            self._literals[expr] = expr.define(self)
+        return self._literals[expr]
+
+    def tseitin_clauses(self, expr, positive=True):
+        # clauses asserting expr (Not(expr) when positive is False) over Tseitin literals. conjunctions and
+        # disjunctions at the top are asserted directly instead of through an auxiliary atom; the
+        # definitions this needs are left in definitions
+        kind = type(expr)
+        if kind == Not:
+            return self.tseitin_clauses(expr.arg, not positive)
+        if (kind == And and positive) or (kind == Or and not positive):
+            return set().union(*[self.tseitin_clauses(x, positive) for x in expr.hashable])
+        if kind == Or or kind == And:
+            clause = frozenset(self.literal(x) if positive else -self.literal(x) for x in expr.hashable)
+            return set() if is_tautology(clause) else {clause}
+        if kind == Implies:
+            return self.tseitin_clauses(Or(Not(expr.left), expr.right), positive)
+        literal = self.literal(expr)
+        return {frozenset([literal if positive else -literal])}
+
+
+############################################################
+# Section 1b: SAT Solver
+############################################################
+
+def luby(i):
+    # the i-th term (from 1) of the Luby sequence 1 1 2 1 1 2 4 1 1 2 ...
+    while True:
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+        if (1 << k) - 1 == i:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+class Solver(object):
+    # conflict-driven clause learning over clauses of signed integer literals (Section 1a):
+    #   - unit propagation with two watched literals per clause; clause[0] and clause[1] are the watched
+    #     ones, and a clause that forced a literal keeps that literal in clause[0] while it is assigned
+    #   - on a conflict, the first-UIP clause is learned and the search jumps back to the second highest
+    #     decision level in it, where that clause forces its first literal
+    #   - branching on the unassigned atom of highest VSIDS activity (bumped for the atoms of each conflict,
+    #     decaying over time), with the value it last had (phase saving)
+    #   - restarts after RESTART_BASE times the terms of the Luby sequence in conflicts
+    # solve() can take assumptions, literals decided first and taken back afterwards, so one solver answers
+    # many queries against the same clauses; the learned clauses follow from the clauses alone and stay.
+    RESTART_BASE = 100
+    DECAY = 0.95
+
+    def __init__(self):
+        self.values = [0]       # atom -> 1 (true), -1 (false) or 0 (unassigned)
+        self.levels = [0]       # atom -> decision level it was assigned at
+        self.reasons = [None]   # atom -> clause that forced it, None for decisions and level 0 facts
+        self.activity = [0.0]   # atom -> VSIDS activity
+        self.phase = [False]    # atom -> value it was last assigned
+        self.watches = {}       # literal -> clauses watching it
+        self.clauses = []
+        self.learned = []
+        self.trail = []         # assigned literals in assignment order
+        self.trail_limits = []  # where on the trail each decision level starts
+        self.queue_head = 0     # trail literals before this have been propagated
+        self.order = []         # heap of (-activity, atom), with stale entries skipped on the way out
+        self.increment = 1.0
+        self.ok = True          # False once the clauses are unsatisfiable without any assumptions
+        self.model = None
+        self.conflicts = 0
+        self.decisions = 0
+        self.propagations = 0
+        self.restarts = 0
+
+    def ensure_atom(self, atom):
+        while len(self.values) <= atom:
+            new = len(self.values)
+            self.values.append(0)
+            self.levels.append(0)
+            self.reasons.append(None)
+            self.activity.append(0.0)
+            self.phase.append(False)
+            self.watches[new] = []
+            self.watches[-new] = []
+            heapq.heappush(self.order, (0.0, new))
+
+    def value(self, literal):
+        value = self.values[abs(literal)]
+        return value if literal > 0 else -value
+
+    def add_clause(self, literals):
+        # adds a clause for good (between solve() calls); False once the clauses are unsatisfiable
+        if not self.ok:
+            return False
+        clause = set()
+        for literal in literals:
+            self.ensure_atom(abs(literal))
+            value = self.value(literal)
+            if value == 1 or -literal in clause:
+                return True  # satisfied by a level 0 fact, or a tautology
+            if value == 0:
+                clause.add(literal)
+        clause = list(clause)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self._assign(clause[0], None)
+            self.ok = self._propagate() is None
+        else:
+            self._attach(clause)
+            self.clauses.append(clause)
+        return self.ok
+
+    def solve(self, assumptions=()):
+        # True if the clauses and the assumptions can all be satisfied, leaving a satisfying assignment in
+        # model (atom -> bool); the solver is back at level 0 afterwards, ready for more clauses or queries
+        self.model = None
+        if not self.ok:
+            return False
+        for literal in assumptions:
+            self.ensure_atom(abs(literal))
+        restart = 1
+        budget = self.RESTART_BASE * luby(restart)
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                budget -= 1
+                if not self.trail_limits:
+                    self.ok = False
+                    return False
+                learned, level = self._analyze(conflict)
+                self._backtrack(level)
+                if len(learned) == 1:
+                    self._assign(learned[0], None)
+                else:
+                    self._attach(learned)
+                    self.learned.append(learned)
+                    self._assign(learned[0], learned)
+                self.increment /= self.DECAY
+                continue
+
+            if budget <= 0:
+                self._backtrack(0)
+                self.restarts += 1
+                restart += 1
+                budget = self.RESTART_BASE * luby(restart)
+
+            decision = None
+            while len(self.trail_limits) < len(assumptions):
+                assumption = assumptions[len(self.trail_limits)]
+                value = self.value(assumption)
+                if value == 1:
+                    self.trail_limits.append(len(self.trail))  # already true: an empty level keeps the count
+                elif value == -1:
+                    self._backtrack(0)
+                    return False
+                else:
+                    decision = assumption
+                    break
+            if decision is None:
+                decision = self._pick_branch()
+                if decision is None:
+                    self.model = dict((atom, self.values[atom] > 0) for atom in range(1, len(self.values)))
+                    self._backtrack(0)
+                    return True
+                self.decisions += 1
+            self.trail_limits.append(len(self.trail))
+            self._assign(decision, None)
+
+    def _attach(self, clause):
+        self.watches[clause[0]].append(clause)
+        self.watches[clause[1]].append(clause)
+
+    def _assign(self, literal, reason):
+        atom = abs(literal)
+        self.values[atom] = 1 if literal > 0 else -1
+        self.levels[atom] = len(self.trail_limits)
+        self.reasons[atom] = reason
+        self.trail.append(literal)
+
+    def _propagate(self):
+        # assigns every literal forced by a clause, returning a clause all of whose literals are false, if any
+        values = self.values
+        watches = self.watches
+        trail = self.trail
+        while self.queue_head < len(trail):
+            false_literal = -trail[self.queue_head]
+            self.queue_head += 1
+            self.propagations += 1
+            watchers = watches[false_literal]
+            watches[false_literal] = kept = []
+            for i, clause in enumerate(watchers):
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                first = clause[0]
+                first_value = values[first] if first > 0 else -values[-first]
+                if first_value == 1:
+                    kept.append(clause)
+                    continue
+                for k in range(2, len(clause)):
+                    literal = clause[k]
+                    if (values[literal] if literal > 0 else -values[-literal]) != -1:
+                        clause[1], clause[k] = literal, false_literal
+                        watches[literal].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if first_value == -1:
+                        kept.extend(watchers[i + 1:])
+                        self.queue_head = len(trail)
+                        return clause
+                    self._assign(first, clause)
+        return None
+
+    def _analyze(self, conflict):
+        # the first-UIP clause of the conflict, its asserting literal first and a literal of the level to
+        # jump back to second, and that level
+        levels = self.levels
+        level = len(self.trail_limits)
+        learned = [None]
+        seen = set()
+        pending = 0  # atoms of the current level still to be resolved away
+        index = len(self.trail) - 1
+        clause = conflict
+        literal = None
+        while True:
+            for other in (clause if literal is None else clause[1:]):
+                atom = abs(other)
+                if atom not in seen and levels[atom] > 0:
+                    seen.add(atom)
+                    self._bump(atom)
+                    if levels[atom] == level:
+                        pending += 1
+                    else:
+                        learned.append(other)
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            literal = self.trail[index]
+            index -= 1
+            pending -= 1
+            if not pending:
+                break
+            clause = self.reasons[abs(literal)]
+        learned[0] = -literal
+
+        if len(learned) == 1:
+            return learned, 0
+        second = max(range(1, len(learned)), key=lambda i: levels[abs(learned[i])])
+        learned[1], learned[second] = learned[second], learned[1]
+        return learned, levels[abs(learned[1])]
+
+    def _bump(self, atom):
+        self.activity[atom] += self.increment
+        if self.activity[atom] > 1e100:
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.increment *= 1e-100
+            self.order = [(-self.activity[a], a) for a in range(1, len(self.values)) if not self.values[a]]
+            heapq.heapify(self.order)
+
+    def _pick_branch(self):
+        # the unassigned atom of highest activity as a literal with its saved phase, None when all are assigned
+        order = self.order
+        if len(order) > 2 * len(self.values) + 64:
+            self.order = order = [(-self.activity[a], a) for a in range(1, len(self.values)) if not self.values[a]]
+            heapq.heapify(order)
+        while order:
+            activity, atom = heapq.heappop(order)
+            if not self.values[atom] and -activity == self.activity[atom]:
+                return atom if self.phase[atom] else -atom
+        return None
+
+    def _backtrack(self, level):
+        # undoes every decision level above level
+        if len(self.trail_limits) > level:
+            start = self.trail_limits[level]
+            for literal in self.trail[start:]:
+                atom = abs(literal)
+                self.phase[atom] = literal > 0
+                self.values[atom] = 0
+                self.reasons[atom] = None
+                heapq.heappush(self.order, (-self.activity[atom], atom))
+            del self.trail[start:]
+            del self.trail_limits[level:]
+            self.queue_head = start
+
+
+class ModelCounter(Solver):
+    # counts the assignments satisfying its clauses by DPLL search with component caching, as Cachet and
+    # sharpSAT do:
+    #   - unit propagation is the Solver's, with two watched literals per clause
+    #   - after propagating, the clauses not yet satisfied fall apart into components sharing no unassigned
+    #     atom; their counts multiply, and an unassigned atom in no such clause doubles the count
+    #   - a component is counted by branching on one of its atoms both ways, and only once: its count is
+    #     cached under its canonical key, the bit sets of its unassigned atoms and of the indices of its
+    #     unsatisfied clauses. every assigned literal left in such a clause is false, so the key determines
+    #     the component's clauses whichever assignment led to it
+    #   - the atom branched on is picked as sharpSAT-TD does: when the clauses have a narrow tree
+    #     decomposition (see _elimination_depths), the atom of the component nearest the root of its tree,
+    #     so that branching cuts the component along the decomposition's separators. otherwise, or between
+    #     atoms at the same depth, the atom in the most unsatisfied clauses of the component (ties to the
+    #     lower id): it satisfies or shortens the most clauses either way
+    # there is no clause learning: a conflict just makes the branch count 0.
 
-class KnowledgeBase(object):
     def __init__(self):
-        self.int_fact_set = set()
+        Solver.__init__(self)
+        self.cache = {}
+        self.occurrences = None  # atom -> the clauses mentioning it, as (index, clause)
+        self.depths = None  # atom -> its depth in the elimination tree, all 0 when the tree is not used
+        self.branches = 0
+
+    def count(self, variables):
+        # the number of assignments to variables (atom ids, including every atom of the clauses) satisfying
+        # every clause; atoms the clauses fix at level 0 have one value, the others are counted
+        if not self.ok:
+            return 0
+        variables = set(variables)
+        for atom in variables:
+            self.ensure_atom(atom)
+        self.occurrences = [[] for _ in self.values]
+        for index, clause in enumerate(self.clauses):
+            for literal in clause:
+                self.occurrences[abs(literal)].append((index, clause))
+        self.depths = self._elimination_depths()
+        return self._count([atom for atom in variables if not self.values[atom]])
+
+    def _elimination_depths(self):
+        # the depth of each atom in the elimination tree of a min-degree elimination order of the clauses'
+        # graph, whose edges join the unassigned atoms of each clause not yet satisfied. an atom's parent is
+        # the first eliminated after it of its neighbours when it was eliminated, so an atom and its
+        # ancestors separate the atoms below it from the rest. the largest such neighbourhood (the width)
+        # bounds the separators; when it is over a quarter of the atoms, as it is for random clauses, the
+        # tree is no guide and every depth is 0
+        depths = [0] * len(self.values)
+        neighbours = {}
+        for clause in self.clauses:
+            if any(self.value(literal) == 1 for literal in clause):
+                continue
+            atoms = [abs(literal) for literal in clause if not self.value(literal)]
+            for atom in atoms:
+                neighbours.setdefault(atom, set()).update(atoms)
+        for atom, adjacent in neighbours.items():
+            adjacent.discard(atom)
+        heap = [(len(adjacent), atom) for atom, adjacent in neighbours.items()]
+        heapq.heapify(heap)
+        order = []
+        positions = {}
+        while heap:
+            degree, atom = heapq.heappop(heap)
+            if atom in positions or degree != len(neighbours[atom]):
+                continue
+            if degree * 4 > len(neighbours):
+                return depths
+            positions[atom] = len(order)
+            order.append(atom)
+            adjacent = neighbours[atom]  # no longer changes: only atoms not yet eliminated gain neighbours
+            for other in adjacent:
+                others = neighbours[other]
+                others.discard(atom)
+                others.update(adjacent)
+                others.discard(other)
+                heapq.heappush(heap, (len(others), other))
+        for atom in reversed(order):
+            if neighbours[atom]:
+                depths[atom] = depths[min(neighbours[atom], key=positions.get)] + 1
+        return depths
+
+    def _count(self, atoms):
+        # the number of assignments to the unassigned atoms among atoms satisfying the clauses they are in;
+        # those clauses mention no other unassigned atom
+        total = 1
+        cache = self.cache
+        for component, key, branch in self._components(atoms):
+            if key is None:
+                total *= 2
+                continue
+            count = cache.get(key)
+            if count is None:
+                count = cache[key] = self._branch(component, branch)
+            total *= count
+            if not total:
+                return 0
+        return total
+
+    def _components(self, atoms):
+        # (atoms, key, atom to branch on) for each group of the unassigned atoms connected through
+        # unsatisfied clauses; key is None for an atom in no unsatisfied clause
+        values, occurrences, depths = self.values, self.occurrences, self.depths
+        seen = set()
+        satisfied = set()
+        components = []
+        for start in atoms:
+            if values[start] or start in seen:
+                continue
+            seen.add(start)
+            component = [start]
+            stack = [start]
+            atom_bits = clause_bits = 0
+            best, best_depth, best_score = start, depths[start], -1
+            while stack:
+                atom = stack.pop()
+                atom_bits |= 1 << atom
+                score = 0
+                for index, clause in occurrences[atom]:
+                    if index in satisfied:
+                        continue
+                    if clause_bits >> index & 1:
+                        score += 1
+                        continue
+                    open_atoms = []
+                    for literal in clause:
+                        value = values[literal] if literal > 0 else -values[-literal]
+                        if value == 1:
+                            break
+                        if not value:
+                            open_atoms.append(abs(literal))
+                    else:
+                        score += 1
+                        clause_bits |= 1 << index
+                        for other in open_atoms:
+                            if other not in seen:
+                                seen.add(other)
+                                component.append(other)
+                                stack.append(other)
+                        continue
+                    satisfied.add(index)
+                depth = depths[atom]
+                if depth < best_depth or depth == best_depth and \
+                        (score > best_score or score == best_score and atom < best):
+                    best, best_depth, best_score = atom, depth, score
+            components.append((component, (atom_bits, clause_bits) if clause_bits else None, best))
+        return components
+
+    def _branch(self, atoms, atom):
+        # the count of a component: the counts with atom true and with it false, each after propagation
+        total = 0
+        values = self.values
+        for literal in (atom, -atom):
+            self.branches += 1
+            level = len(self.trail_limits)
+            self.trail_limits.append(len(self.trail))
+            self._assign(literal, None)
+            if self._propagate() is None:
+                total += self._count([other for other in atoms if not values[other]])
+            self._undo(level)
+        return total
+
+    def _undo(self, level):
+        # takes back every assignment above level; unlike _backtrack it keeps no phases or branching order,
+        # which counting does not use
+        start = self.trail_limits[level]
+        values, reasons = self.values, self.reasons
+        for literal in self.trail[start:]:
+            values[abs(literal)] = 0
+            reasons[abs(literal)] = None
+        del self.trail[start:]
+        del self.trail_limits[level:]
+        self.queue_head = start
+
+
+class KnowledgeBase(object):
+    # facts are converted to clauses once, when told, and fed to one Solver that lives as long as the kb, so
+    # its learned clauses carry over from query to query. a query asks the solver for a model of the facts
+    # under the assumption that the goal's Tseitin literal is false; the goal's definition clauses only
+    # constrain that literal, so they stay in the solver and nothing has to be taken back afterwards.
+    # answers are cached: an entailed goal stays entailed whatever facts are added later, while a goal that
+    # was not entailed is only known not to be at the version (number of fact changes) it was asked at.
+    # goals whose clauses are each already implied by a single fact or a level 0 literal need no search;
+    # that check needs the goal's CNF, so it is only made for goals with at most SUBSUME_LIMIT clauses.
+    SUBSUME_LIMIT = 64
+
+    def __init__(self, tseitin=False):
+        # tseitin=True encodes facts and queries with AtomTable's Tseitin literals instead of the exact CNF,
+        # which keeps nested Iffs and disjunctions of conjunctions linear in size; the facts then mention
+        # auxiliary atoms named "#<id>"
+        self.atoms = AtomTable()
+        self.int_fact_set = set()  # clauses, see Section 1a
+        self.tseitin = tseitin
+        self.solver = Solver()
+        self.version = 0           # bumped whenever a fact is added
+        self.searches = 0          # queries that needed the solver
+        self._entailed = set()
+        self._not_entailed = {}    # goal -> version it was found not entailed at
+        self._occurrences = {}     # literal -> facts containing it
+        self._held = {}            # auxiliary atom -> the definition a query gave only to the solver
         pass
 
+    def clauses(self, expr, positive=True):
+        # the clauses of expr (of Not(expr) when positive is False) in this kb's encoding; any new Tseitin
+        # definitions go straight into the facts
+        if not self.tseitin:
+            return self.atoms.clauses(expr, positive)
+        clauses = self.atoms.tseitin_clauses(expr, positive)
+        self.add_clauses(self.atoms.take_definitions())
+        return clauses
+
+    def add_clauses(self, clauses):
+        new = [clause for clause in clauses if clause not in self.int_fact_set]
+        if self._held:
+            # a fact over a Tseitin literal a query defined brings that definition (and those it relies on)
+            # into the facts, so that the facts stay self-contained
+            pending = [abs(literal) for clause in new for literal in clause]
+            while pending:
+                held = self._held.pop(pending.pop(), ())
+                new.extend(clause for clause in held if clause not in self.int_fact_set)
+                pending.extend(abs(literal) for clause in held for literal in clause)
+        if new:
+            self.version += 1
+        for clause in new:
+            self.int_fact_set.add(clause)
+            self.solver.add_clause(clause)
+            for literal in clause:
+                self._occurrences.setdefault(literal, []).append(clause)
+
     def get_facts(self):
         #return an internal fact set, respectively.
-        return self.int_fact_set
+        return set(self.atoms.clause_expr(clause) for clause in self.int_fact_set)
         pass
 
     def tell(self, expr):
         #converts the input expression to conjunctive normal form and adds the resulting conjuncts to the internal fact set
-        self.int_fact_set.add(expr.to_cnf())
+        # the conjuncts are kept as clauses; tautologies never get there and duplicates fall away in the set
+        self.add_clauses(self.clauses(expr))
         pass
 
     def ask(self, expr):
@@ -253,12 +1103,41 @@ class KnowledgeBase(object):
         #resolution alg :
         #1) convert all to cnf.
         #2) Apply bi-cond/imp/demorg/or if applicable)
-        kb = self.get_facts()
-        neg = Not(expr)
-        #clauses = set of clauses in the cnf rep of kb and neg(exp)
-        clauses = And(*kb, neg).to_cnf()
-        resolvents = list(satisfying_assignments(clauses)) #list of satisfying clauses
-        if not resolvents: #if resolvents contains the empty clause return True
+        # the kb entails expr when the kb's clauses together with Not(expr) cannot all be satisfied
+        if expr in self._entailed:
             return True
-        return False
+        if self._not_entailed.get(expr) == self.version:
+            return False
+        if self.subsumes(expr):
+            entailed = True
+        else:
+            # the goal's definitions go to the solver only: they are not facts about the user's atoms, so
+            # the solver can keep them, but the facts and their version (which the cached answers are
+            # checked against) do not change
+            goal = self.atoms.literal(expr)
+            for clause in self.atoms.take_definitions():
+                self.solver.add_clause(clause)
+                if self.tseitin:
+                    # each definition clause has its auxiliary atom, the newest of its atoms, in it
+                    self._held.setdefault(max(abs(literal) for literal in clause), []).append(clause)
+            self.searches += 1
+            entailed = not self.solver.solve([-goal])
+        if entailed:
+            self._entailed.add(expr)
+        else:
+            self._not_entailed[expr] = self.version
+        return entailed
         pass
+
+    def subsumes(self, expr):
+        # whether every clause of expr contains a fact or a literal the facts force without any search. only
+        # tried with the exact encoding, where the goal's clauses are also its CNF, and for small goals
+        if self.tseitin or self.atoms.clause_bound(expr) > self.SUBSUME_LIMIT:
+            return False
+        solver = self.solver
+        for clause in self.atoms.clauses(expr):
+            if any(abs(literal) < len(solver.values) and solver.value(literal) == 1 for literal in clause):
+                continue
+            if not any(fact <= clause for literal in clause for fact in self._occurrences.get(literal, ())):
+                return False
+        return True
@@ -0,0 +1,10 @@
+############################################################
+# Imports
+############################################################
+from os.path import abspath, dirname, join
+import sys
+
+# the projects are plain scripts in their own directories, imported by module name
+ROOT = dirname(dirname(abspath(__file__)))
+for project in ("SudokuGame", "PartOfSpeech", "SpamFiltering", "TextualPuzzle", "Benchmarks"):
+    sys.path.insert(0, join(ROOT, project))
@@ -0,0 +1,65 @@
+############################################################
+# Imports
+############################################################
+from collections import defaultdict
+
+from benchmark import compare, make_corpus, measure
+from POS_Tagging_Markov import load_corpus
+
+
+############################################################
+# Section 1: Synthetic corpus
+############################################################
+
+def test_held_out_sentences_come_from_the_training_hmm(tmp_path):
+    training = load_corpus(make_corpus(str(tmp_path / "train.txt"), 400, vocabulary=300, seed=5))
+    held_out = load_corpus(make_corpus(str(tmp_path / "held.txt"), 100, vocabulary=300, seed=5, sample_seed=6))
+    tags_of = defaultdict(set)
+    for sentence in training:
+        for word, tag in sentence:
+            tags_of[word].add(tag)
+    held_words = [word for sentence in held_out for (word, tag) in sentence]
+    # the same vocabulary and the same emissions: hardly a held-out word is new ...
+    assert sum(word not in tags_of for word in held_words) < 0.01 * len(held_words)
+    # ... and some words are emitted by several tags, so the words alone do not give the tags away
+    assert sum(len(tags) > 1 for tags in tags_of.values()) >= 20
+    # a different sample_seed draws different sentences
+    assert held_out[:10] != training[:10]
+
+
+############################################################
+# Section 2: Measurement
+############################################################
+
+def test_measure_repeats_with_fresh_inputs():
+    calls = []
+    setups = []
+    def setup(x):
+        setups.append(x)
+        return [x]
+    def function(argument):
+        # a setup whose result a call changes would fail here on a later repeat
+        assert len(argument) == 1
+        argument.append(None)
+        calls.append(argument[0])
+    result = measure("test", function, [1, 2, 3], setup, memory=False, repeats=4, warmup=1)
+    assert result["calls"] == 12
+    assert calls == [1] + [1, 2, 3] * 4
+    assert len(setups) == 1 + 12
+    assert result["p50_ms"] <= result["p99_ms"]
+
+def measured(calls, per_second=100.0, p99_ms=1.0, accuracy=None):
+    return {"calls": calls, "per_second": per_second, "p99_ms": p99_ms, "p50_ms": 0.5, "accuracy": accuracy}
+
+def test_compare_needs_enough_samples_for_the_tail():
+    baseline = {"benchmarks": {"few": measured(50), "many": measured(500)}}
+    results = {"benchmarks": {"few": measured(50, p99_ms=3.0), "many": measured(500, p99_ms=3.0)}}
+    flagged = [(r["benchmark"], r["metric"]) for r in compare(results, baseline)]
+    assert flagged == [("many", "p99_ms")]
+
+def test_compare_flags_throughput_and_accuracy():
+    baseline = {"benchmarks": {"a": measured(500, accuracy=0.9), "b": measured(500), "c": measured(500)}}
+    results = {"benchmarks": {"a": measured(500, accuracy=0.85), "b": measured(500, per_second=70.0),
+                              "c": measured(500, per_second=90.0, p99_ms=1.1), "new": measured(500)}}
+    flagged = [(r["benchmark"], r["metric"]) for r in compare(results, baseline)]
+    assert flagged == [("a", "accuracy"), ("b", "per_second")]
@@ -0,0 +1,334 @@
+############################################################
+# Imports
+############################################################
+import asyncio
+from collections import Counter
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+
+import pytest
+
+import FilterSpamEmail
+from FilterSpamEmail import SpamFilter, TokenCache, count_tokens, iter_tokens, load_tokens, log_probs
+from SpamServer import ScoringServer, generate_load, read_frame, read_messages, score_messages, server_stats, write_frame
+
+
+############################################################
+# Section 1: Synthetic mail
+############################################################
+
+def write_mail(directory, count, words, seed):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for n in range(count):
+        body = "\n".join(" ".join(rng.choice(words) for _ in range(rng.randint(2, 10))) for _ in range(rng.randint(1, 6)))
+        with open(os.path.join(directory, "%04d.eml" % n), "w") as file:
+            file.write("Subject: message %d\n\n%s\n" % (n, body))
+
+@pytest.fixture(scope="module")
+def mail(tmp_path_factory):
+    root = tmp_path_factory.mktemp("mail")
+    common = ["w%d" % k for k in range(40)]
+    write_mail(str(root / "spam"), 30, common + ["offer%d" % k for k in range(10)], seed=1)
+    write_mail(str(root / "ham"), 40, common + ["meeting%d" % k for k in range(10)], seed=2)
+    write_mail(str(root / "test"), 20, common + ["offer1", "meeting1"], seed=3)
+    return root
+
+def mail_paths(directory):
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory))
+
+def scores(spam_filter, paths):
+    return [spam_filter.score(path) for path in paths]
+
+
+############################################################
+# Section 2: Token counting
+############################################################
+
+def test_counting_in_one_pass_matches_counting_each_message(mail):
+    paths = mail_paths(str(mail / "spam")) + mail_paths(str(mail / "ham"))
+    expected = Counter()
+    for path in paths:
+        expected.update(Counter(load_tokens(path)))
+    # paths may be a one-shot iterator, and the tokens come out in file order
+    counts = count_tokens(iter(paths))
+    assert counts == expected
+    assert list(counts) == list(Counter(token for path in paths for token in load_tokens(path)))
+    assert list(iter_tokens(paths[:3])) == [token for path in paths[:3] for token in load_tokens(path)]
+
+def test_streaming_holds_one_message_at_a_time(mail):
+    # the next file is only opened once the tokens of the one before have all been read
+    opened = []
+    def paths():
+        for path in mail_paths(str(mail / "spam"))[:4]:
+            opened.append(path)
+            yield path
+    tokens = iter_tokens(paths())
+    next(tokens)
+    assert len(opened) == 1
+
+def test_log_probs_of_no_mail():
+    assert dict(log_probs([], 1e-5)) == {"<UNK>": 0.0}
+
+
+############################################################
+# Section 3: Training
+############################################################
+
+def test_parallel_training_matches_serial_training(mail):
+    serial = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5)
+    # chunks small enough that every label is split over several tasks
+    parallel = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5, workers=2, chunksize=7)
+    for label in ("spam", "ham"):
+        assert parallel.counts[label] == serial.counts[label]
+        assert list(parallel.counts[label]) == list(serial.counts[label])  # same first-seen order
+        assert parallel.totals[label] == serial.totals[label]
+        assert parallel.messages[label] == serial.messages[label]
+    paths = mail_paths(str(mail / "test"))
+    assert scores(parallel, paths) == scores(serial, paths)
+
+
+############################################################
+# Section 4: Learning
+############################################################
+
+def test_learn_and_unlearn_match_retraining(mail, tmp_path):
+    spam, ham = str(mail / "spam"), str(mail / "ham")
+    paths = mail_paths(str(mail / "test"))
+    full = SpamFilter(spam, ham, 1e-5)
+
+    # one spam message held out of training, then learned
+    partial_spam = str(tmp_path / "spam")
+    shutil.copytree(spam, partial_spam)
+    held_out = mail_paths(partial_spam)[0]
+    moved = str(tmp_path / "held_out.eml")
+    shutil.move(held_out, moved)
+    learned = SpamFilter(partial_spam, ham, 1e-5)
+    learned.most_indicative_spam(5)  # builds the cached tables that learn() has to keep up to date
+    learned.learn(moved, "spam")
+    assert scores(learned, paths) == pytest.approx(scores(full, paths))
+    assert learned.most_indicative_spam(10) == full.most_indicative_spam(10)
+
+    learned.unlearn(moved, "spam")
+    assert scores(learned, paths) == pytest.approx(scores(SpamFilter(partial_spam, ham, 1e-5), paths))
+    never_learned = str(tmp_path / "never_learned.eml")
+    with open(never_learned, "w") as file:
+        file.write("Subject: new\n\nunheard of words\n")
+    with pytest.raises(ValueError):
+        learned.unlearn(never_learned, "ham")
+    with pytest.raises(ValueError):
+        learned.learn(never_learned, "junk")
+
+def test_empty_model_built_with_learn(mail, tmp_path):
+    empty = str(tmp_path / "empty")
+    os.makedirs(empty)
+    spam_filter = SpamFilter(empty, empty, 1e-5)
+    paths = mail_paths(str(mail / "test"))
+    assert scores(spam_filter, paths) == [0.0] * len(paths)
+    assert spam_filter.most_indicative_ham(3) == ["<UNK>"]
+    for path in mail_paths(str(mail / "spam")):
+        spam_filter.learn(path, "spam")
+    scores(spam_filter, paths)
+    spam_filter.most_indicative_ham(3)
+    for path in mail_paths(str(mail / "ham")):
+        spam_filter.learn(path, "ham")
+    full = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5)
+    assert scores(spam_filter, paths) == pytest.approx(scores(full, paths))
+
+def test_learned_counts_can_be_given_as_a_mapping(mail):
+    spam_filter = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5)
+    path = mail_paths(str(mail / "test"))[0]
+    before = scores(spam_filter, mail_paths(str(mail / "test")))
+    spam_filter.learn(Counter(load_tokens(path)), "ham")
+    spam_filter.unlearn(path, "ham")
+    assert scores(spam_filter, mail_paths(str(mail / "test"))) == pytest.approx(before)
+
+
+############################################################
+# Section 5: Scoring
+############################################################
+
+def reference_score(spam_filter, path):
+    # the sum of per-token log-probabilities, looked up in each class's dictionary
+    score = spam_filter.p_spam - spam_filter.p_ham
+    for label, sign in (("spam", 1), ("ham", -1)):
+        table = spam_filter.log_prob_table(label)
+        score += sign * sum(table[token] if token in table else table["<UNK>"] for token in load_tokens(path))
+    return score
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_classify_batch_matches_is_spam(mail, workers):
+    spam_filter = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5)
+    paths = mail_paths(str(mail / "test")) + mail_paths(str(mail / "spam"))[:5]
+    with open(paths[0], "rb") as file:
+        raw = file.read()
+    results = spam_filter.classify_batch(paths + [raw], workers=workers, chunksize=4)
+    assert len(results) == len(paths) + 1
+    for (score, spam), path in zip(results, paths + [paths[0]]):
+        assert score == pytest.approx(reference_score(spam_filter, path))
+        assert spam == spam_filter.is_spam(path)
+    assert any(spam for score, spam in results) and not all(spam for score, spam in results)
+    assert spam_filter.classify_batch([]) == []
+
+
+############################################################
+# Section 6: Indicative tokens
+############################################################
+
+def full_ranking(spam_filter, label):
+    return [token for score, position, token in sorted(spam_filter.indicative_scores(label))]
+
+@pytest.mark.parametrize("label", ["spam", "ham"])
+def test_paging_matches_a_full_sort(mail, label):
+    spam_filter = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5)
+    expected = full_ranking(spam_filter, label)
+    # pages asked out of order, overlapping, and running past the end
+    for n, start in ((5, 0), (3, 10), (7, 2), (10, 5), (50, len(expected) - 20), (5, len(expected) + 3)):
+        assert spam_filter.most_indicative(label, n, start) == expected[start:start + n]
+    assert spam_filter.most_indicative(label, len(expected)) == expected
+    assert expected[:10] == (spam_filter.most_indicative_spam(10) if label == "spam" else
+                             spam_filter.most_indicative_ham(10))
+    # a learned message changes the ranking; the cached one is not reused
+    spam_filter.learn(mail_paths(str(mail / "test"))[0], label)
+    assert spam_filter.most_indicative(label, 15) == full_ranking(spam_filter, label)[:15]
+
+
+############################################################
+# Section 7: Saved models
+############################################################
+
+def test_save_load_round_trip(mail, tmp_path):
+    spam_filter = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5)
+    path = str(tmp_path / "filter.model")
+    spam_filter.save(path)
+    loaded = SpamFilter.load(path)
+    paths = mail_paths(str(mail / "test"))
+    assert scores(loaded, paths) == pytest.approx(scores(spam_filter, paths))
+    assert loaded.most_indicative_spam(10) == spam_filter.most_indicative_spam(10)
+    assert loaded.most_indicative_ham(10) == spam_filter.most_indicative_ham(10)
+
+def test_load_rejects_other_files(tmp_path):
+    path = str(tmp_path / "not.model")
+    with open(path, "wb") as file:
+        file.write(b"Subject: hello\n\nnot a model\n")
+    with pytest.raises(ValueError):
+        SpamFilter.load(path)
+
+
+############################################################
+# Section 8: Token cache
+############################################################
+
+def test_cached_classification_reads_each_file_once(mail, tmp_path, monkeypatch):
+    spam_filter = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5, token_cache=TokenCache())
+    paths = mail_paths(str(mail / "test"))
+    # a body that is not ASCII, which a path (read as text) and raw bytes decode differently
+    accented = str(tmp_path / "accented.eml")
+    with open(accented, "w", encoding="utf-8") as file:
+        file.write("Subject: caf\u00e9\n\nw1 caf\u00e9 offer1 na\u00efve\n")
+    paths.append(accented)
+    expected = [spam_filter.score_counts(Counter(load_tokens(path))) for path in paths]
+
+    opened = []
+    def counting_open(path, *args, **kwargs):
+        opened.append(path)
+        return open(path, *args, **kwargs)
+    monkeypatch.setattr(FilterSpamEmail, "open", counting_open, raising=False)
+    first = spam_filter.classify_batch(paths)
+    assert sorted(opened) == sorted(paths)
+    assert [score for score, spam in first] == pytest.approx(expected)
+    second = spam_filter.classify_batch(paths + paths)
+    assert second == first + first
+    assert spam_filter.token_cache.stats()["hits"] == 2 * len(paths)
+    assert spam_filter.token_counts(accented) == Counter(load_tokens(accented))
+    monkeypatch.undo()
+
+    # the pool parses the same content the serial path does
+    fresh = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5, token_cache=TokenCache())
+    assert fresh.classify_batch(paths, workers=2, chunksize=3) == first
+
+def test_token_cache_stays_within_budget():
+    rng = random.Random(0)
+    cache = TokenCache(max_bytes=20000)
+    messages = {}
+    for n in range(500):
+        counts = Counter("t%d" % rng.randrange(100000) for _ in range(rng.randint(1, 60)))
+        key = b"b%d" % n
+        messages[key] = counts
+        cache.put(key, counts)
+        assert cache.size <= cache.max_bytes
+        held = set(token_id for ids in cache.entries.values() for token_id in ids)
+        assert set(cache.ids.values()) == held
+        assert cache.size == sum(len(ids) * ids.itemsize for ids in cache.entries.values()) + \
+            sum(sys.getsizeof(token) + cache.TOKEN_OVERHEAD for token in cache.ids)
+    for key in list(cache.entries):
+        assert cache.get(key) == messages[key]
+    cache.put(b"too big", Counter("x%d" % k for k in range(5000)))
+    assert b"too big" not in cache.entries and cache.entries
+
+
+############################################################
+# Section 9: Scoring server
+############################################################
+
+def test_server_answers_match_classify_batch(mail):
+    spam_filter = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5, token_cache=TokenCache())
+    messages = read_messages([str(mail / "test"), str(mail / "spam")])
+    expected = [{"score": score, "spam": spam} for score, spam in spam_filter.classify_batch(messages)]
+
+    async def run():
+        server = ScoringServer(spam_filter, max_batch=8, max_pending=16)
+        await server.start("127.0.0.1", 0)
+        port = server.address()[1]
+        try:
+            answers = await score_messages(messages, port=port)
+            report = await generate_load(messages, port=port, connections=3, requests=200, window=5)
+            stats = await server_stats(port=port)
+        finally:
+            await server.close()
+        return answers, report, stats
+
+    answers, report, stats = asyncio.run(run())
+    assert [answer["spam"] for answer in answers] == [answer["spam"] for answer in expected]
+    assert [answer["score"] for answer in answers] == pytest.approx([answer["score"] for answer in expected])
+    assert report["requests"] == 200 and report["p50_ms"] <= report["p99_ms"]
+    assert report["server"]["requests"] == len(messages) + 200
+    assert stats["errors"] == 0 and stats["in_flight"] == 1  # the stats request itself
+
+def test_server_stops_reading_from_a_client_that_never_reads(mail):
+    spam_filter = SpamFilter(str(mail / "spam"), str(mail / "ham"), 1e-5)
+    message = read_messages([str(mail / "test")])[0]
+    sent = 20000
+
+    async def run():
+        server = ScoringServer(spam_filter, max_pending=4, max_delay=0)
+        await server.start("127.0.0.1", 0)
+        # small socket buffers on both ends, so that what TCP itself holds is small next to sent
+        for listening in server.server.sockets:
+            listening.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        client = socket.socket()
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        client.connect(server.address())
+        reader, writer = await asyncio.open_connection(sock=client)
+        for _ in range(sent):
+            write_frame(writer, message)
+        try:
+            for _ in range(20):
+                await asyncio.sleep(0.05)
+                assert server.in_flight <= server.max_pending
+            stalled = server.requests
+            # once the client reads, everything it sent is answered, in order
+            for _ in range(sent):
+                assert "score" in json.loads(await read_frame(reader))
+            return stalled, server.requests, server.in_flight
+        finally:
+            writer.close()
+            await server.close()
+
+    stalled, answered, in_flight = asyncio.run(run())
+    assert stalled < sent // 2
+    assert answered == sent and in_flight == 0
@@ -0,0 +1,312 @@
+############################################################
+# Imports
+############################################################
+import random
+
+import pytest
+
+from Sudoku import (CageSums, HiddenSingles, LockedCandidates, NakedSubsets, Propagator, Sudoku, SudokuGrid,
+                    bits_of, board_from_string, board_to_string, diagonal_units, is_valid_solution,
+                    mask_to_values, read_board, solve_batch, values_to_mask)
+
+
+############################################################
+# Section 1: Puzzles
+############################################################
+
+EASY = "003020600900305001001806400008102900700000008006708200002609500800203009005010300"
+EASY_SOLUTION = "483921657967345821251876493548132976729564138136798245372689514814253769695417382"
+
+HARD = ["4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+        "52...6.........7.13...........4..8..6......5...........418.........3..2...87.....",
+        "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4.."]
+
+
+############################################################
+# Section 2: Bitmask board
+############################################################
+
+def test_masks_round_trip():
+    for values in ({1}, {9}, {2, 5, 7}, set(range(1, 10)), set()):
+        mask = values_to_mask(values)
+        assert mask_to_values(mask) == values
+        assert [value + 1 for value in bits_of(mask)] == sorted(values)
+
+def test_peers_of_the_classic_grid():
+    grid = SudokuGrid.get(3)
+    assert all(len(peers) == 20 for peers in grid.peers)
+    assert len(grid.arcs) == 81 * 20
+    for cell, peer in grid.arcs:
+        assert cell != peer
+        same_box = (cell[0] // 3, cell[1] // 3) == (peer[0] // 3, peer[1] // 3)
+        assert cell[0] == peer[0] or cell[1] == peer[1] or same_box
+
+def test_ac3_solves_an_easy_puzzle():
+    sudoku = Sudoku(board_from_string(EASY))
+    assert sudoku.infer_ac3()
+    assert board_to_string(sudoku.board) == EASY_SOLUTION
+    assert is_valid_solution(sudoku)
+
+def test_ac3_detects_a_contradiction():
+    assert not Sudoku(board_from_string("11" + "." * 79)).infer_ac3()
+
+def test_board_view_writes_through():
+    sudoku = Sudoku(board_from_string(EASY))
+    sudoku.board[(0, 0)] = {4}
+    assert sudoku.get_values((0, 0)) == {4}
+    assert dict(sudoku.board)[(0, 2)] == {3}
+
+
+############################################################
+# Section 3: Batch solving
+############################################################
+
+BATCH = [EASY] + HARD + ["11" + "." * 79] + HARD
+
+def check_results(results, puzzles=BATCH):
+    assert sorted(result.index for result in results) == list(range(len(puzzles)))
+    for result in results:
+        assert result.puzzle == puzzles[result.index]
+        assert result.nodes >= 1
+        if result.puzzle.startswith("11"):
+            assert not result.solved
+        else:
+            assert result.solved
+            sudoku = Sudoku(board_from_string(result.solution))
+            assert is_valid_solution(sudoku)
+            assert all(given in ".0" or given == solved for given, solved in zip(result.puzzle, result.solution))
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_solve_batch_in_order(workers):
+    results = list(solve_batch(BATCH, workers=workers, chunksize=2))
+    assert [result.index for result in results] == list(range(len(BATCH)))
+    check_results(results)
+    assert results[0].solution == EASY_SOLUTION
+
+def test_solve_batch_unordered():
+    check_results(list(solve_batch(BATCH, workers=2, chunksize=1, ordered=False, max_pending=2)))
+
+def test_solve_batch_reads_a_file(tmp_path):
+    path = tmp_path / "puzzles.txt"
+    path.write_text("# a comment\n\n" + "\n".join(BATCH) + "\n")
+    check_results(list(solve_batch(str(path), workers=2, chunksize=3)))
+
+def test_solve_batch_takes_boards():
+    boards = [board_from_string(puzzle) for puzzle in BATCH]
+    # boards go through board_to_string, which writes blanks as "."
+    check_results(list(solve_batch(boards, workers=1)), [board_to_string(board) for board in boards])
+
+
+############################################################
+# Section 4: Search
+############################################################
+
+@pytest.mark.parametrize("puzzle", HARD)
+def test_guessing_solves_hard_puzzles(puzzle):
+    sudoku = Sudoku(board_from_string(puzzle))
+    assert sudoku.infer_with_guessing()
+    assert is_valid_solution(sudoku)
+    assert all(given == "." or given == solved for given, solved in zip(puzzle, board_to_string(sudoku.board)))
+    assert sudoku.nodes >= 1 and sudoku.trail is None
+
+def test_undo_restores_the_board():
+    sudoku = Sudoku(board_from_string("1" + "." * 80))
+    assert sudoku.infer_propagate()
+    masks, places = list(sudoku.masks), list(sudoku.places)
+    sudoku.trail = []
+    i = next(i for i, mask in enumerate(masks) if mask & (mask - 1))
+    sudoku.assign(i, masks[i] & -masks[i])
+    sudoku.propagate()
+    assert sudoku.masks != masks
+    sudoku._undo(0)
+    assert sudoku.masks == masks and sudoku.places == places and not sudoku.conflict
+
+def test_guessing_reports_an_unsolvable_puzzle():
+    # a unique puzzle with one more given that differs from its solution, and clashes with no other given
+    solved = Sudoku(board_from_string(HARD[0]))
+    solved.infer_with_guessing()
+    solution = board_to_string(solved.board)
+    i = HARD[0].index(".")
+    row, column = divmod(i, 9)
+    seen = set(HARD[0][row * 9:row * 9 + 9]) | set(HARD[0][column::9])
+    value = next(v for v in "123456789" if v != solution[i] and v not in seen)
+    puzzle = HARD[0][:i] + value + HARD[0][i + 1:]
+    sudoku = Sudoku(board_from_string(puzzle))
+    assert not sudoku.infer_with_guessing()
+    assert sudoku.trail is None
+
+
+############################################################
+# Section 5: Propagators
+############################################################
+
+# a propagator is sound when it never removes the value a cell has in a solution. the boards below are
+# solved grids with most cells blanked, so that solution is known.
+
+def solved_grid(grid):
+    sudoku = Sudoku({}, grid=grid)
+    assert sudoku.infer_exact_cover()
+    return list(sudoku.masks)
+
+def killer_grid(seed):
+    # horizontal and vertical cages of two or three cells over a solution of the classic grid
+    rng = random.Random(seed)
+    solution = solved_grid(SudokuGrid.get(3))
+    values = [mask.bit_length() for mask in solution]
+    free = set(range(81))
+    cages = []
+    for i in range(81):
+        if i not in free:
+            continue
+        cage = [i]
+        free.discard(i)
+        step, length = rng.choice((1, 9)), rng.randint(2, 3)
+        while len(cage) < length:
+            j = cage[-1] + step
+            if j not in free or (step == 1 and j % 9 == 0):
+                break
+            cage.append(j)
+            free.discard(j)
+        cages.append((cage, sum(values[k] for k in cage)))
+    return SudokuGrid(3, cages=cages), solution
+
+def plain_grid(extra_units):
+    grid = SudokuGrid.get(3, extra_units)
+    return lambda seed: (grid, solved_grid(grid))
+
+GRIDS = [("classic", plain_grid(())), ("diagonal", plain_grid(diagonal_units(3))), ("killer", killer_grid)]
+
+@pytest.mark.parametrize("name, make", GRIDS)
+@pytest.mark.parametrize("seed", range(5))
+def test_propagators_are_sound(name, make, seed):
+    grid, solution = make(seed)
+    rng = random.Random(seed)
+    givens = rng.sample(range(81), rng.randint(10, 30))
+    board = dict((grid.cells[i], mask_to_values(solution[i])) for i in givens)
+    propagators = [HiddenSingles(), NakedSubsets(), NakedSubsets(max_size=4), LockedCandidates(), Propagator()]
+    if grid.cage_totals:
+        propagators.append(CageSums())
+    for propagator in propagators + [None]:
+        sudoku = Sudoku(board, grid=grid, propagators=propagators[:-1])
+        sudoku._reset_queues()
+        assert sudoku.propagate(None if propagator is None else [propagator])
+        assert all(mask & bit for mask, bit in zip(sudoku.masks, solution)), propagator
+    sudoku = Sudoku(board, grid=grid)
+    assert sudoku.infer_propagate()
+    assert all(mask & bit for mask, bit in zip(sudoku.masks, solution))
+
+def test_propagators_narrow_the_board():
+    sudoku = Sudoku(board_from_string(HARD[1]))
+    sudoku.infer_ac3()
+    candidates = lambda: sum(len(bits_of(mask)) for mask in sudoku.masks)
+    after_ac3 = candidates()
+    sudoku.infer_propagate()
+    assert candidates() < after_ac3
+
+
+############################################################
+# Section 6: Larger grids and files
+############################################################
+
+def pattern_solution(box_size):
+    # the standard solved grid of a box size, as a list of rows of values
+    size = box_size * box_size
+    return [[(box_size * (r % box_size) + r // box_size + c) % size + 1 for c in range(size)] for r in range(size)]
+
+@pytest.mark.parametrize("box_size", [2, 4, 5])
+def test_larger_grids_solve(box_size):
+    size = box_size * box_size
+    rows = pattern_solution(box_size)
+    rng = random.Random(box_size)
+    blanks = set(rng.sample(range(size * size), size * size // 2))
+    board = {}
+    for r in range(size):
+        for c in range(size):
+            board[(r, c)] = set(range(1, size + 1)) if r * size + c in blanks else {rows[r][c]}
+    sudoku = Sudoku(board)
+    assert sudoku.size == size
+    assert sudoku.infer_with_guessing()
+    assert is_valid_solution(sudoku)
+
+def test_read_board_formats(tmp_path):
+    classic = tmp_path / "classic.txt"
+    classic.write_text("\n".join(EASY[i:i + 9].replace("0", "*") for i in range(0, 81, 9)) + "\n")
+    assert board_to_string(read_board(str(classic))) == EASY.replace("0", ".")
+
+    rows = pattern_solution(4)
+    letters = tmp_path / "letters.txt"
+    letters.write_text("\n".join("".join("0123456789ABCDEFG"[v] for v in row) for row in rows))
+    assert read_board(str(letters))[(0, 15)] == {rows[0][15]}
+
+    rows = pattern_solution(5)
+    numbers = tmp_path / "numbers.txt"
+    numbers.write_text("\n".join(" ".join(str(v) if c else "." for c, v in enumerate(row)) for row in rows))
+    board = read_board(str(numbers))
+    assert board[(3, 7)] == {rows[3][7]} and board[(3, 0)] == set(range(1, 26))
+
+@pytest.mark.parametrize("lines", [
+    ["A" + EASY[1:9]] + [EASY[i:i + 9] for i in range(9, 81, 9)],        # 10 in a 9x9 grid
+    [" ".join(["12"] + ["."] * 8)] + [" ".join(["."] * 9)] * 8,          # 12 in a 9x9 grid
+    [EASY[:8]] + [EASY[i:i + 9] for i in range(9, 81, 9)],               # a short row
+])
+def test_read_board_rejects_bad_cells(tmp_path, lines):
+    path = tmp_path / "bad.txt"
+    path.write_text("\n".join(lines))
+    with pytest.raises(ValueError):
+        read_board(str(path))
+
+def test_custom_units():
+    # a 4x4 grid whose "boxes" are the four 2x2 corners written out as units of their own
+    units = [[(r, c) for c in range(4)] for r in range(4)] + [[(r, c) for r in range(4)] for c in range(4)]
+    units += [[(r + i, c + j) for i in range(2) for j in range(2)] for r in (0, 2) for c in (0, 2)]
+    grid = SudokuGrid(2, units=units)
+    assert Sudoku({}, grid=grid).count_solutions() == 288
+
+
+############################################################
+# Section 7: Exact cover
+############################################################
+
+@pytest.mark.parametrize("puzzle", HARD)
+def test_exact_cover_matches_guessing(puzzle):
+    guessed = Sudoku(board_from_string(puzzle))
+    assert guessed.infer_with_guessing()
+    covered = Sudoku(board_from_string(puzzle))
+    assert covered.infer_exact_cover()
+    assert is_valid_solution(covered)
+    assert board_to_string(covered.board) == board_to_string(guessed.board)
+    assert Sudoku(board_from_string(puzzle)).count_solutions(2) == 1
+
+def test_count_solutions_of_the_empty_4x4_grid():
+    # the known number of 4x4 Sudoku grids
+    assert Sudoku(board_from_string("." * 16)).count_solutions() == 288
+    assert Sudoku(board_from_string("." * 81)).count_solutions(10) == 10
+
+def test_iter_solutions_are_distinct_and_valid():
+    solutions = list(Sudoku(board_from_string("1..." + "." * 12)).iter_solutions())
+    assert len(solutions) == 288 // 4
+    strings = set()
+    for solution in solutions:
+        sudoku = Sudoku(solution)
+        assert is_valid_solution(sudoku)
+        strings.add(board_to_string(solution))
+    assert len(strings) == len(solutions)
+
+def test_conflicting_board_has_no_solution():
+    sudoku = Sudoku(board_from_string("11" + "." * 79))
+    assert sudoku.count_solutions() == 0
+    assert not sudoku.infer_exact_cover()
+
+def test_variants():
+    diagonal = SudokuGrid(3, extra_units=diagonal_units(3))
+    sudoku = Sudoku({}, grid=diagonal)
+    assert sudoku.infer_exact_cover()
+    assert is_valid_solution(sudoku)
+
+    # a Killer puzzle without givens: cages of horizontal pairs over that solution
+    solution = board_to_string(sudoku.board)
+    starts = [row * 9 + column for row in range(9) for column in range(0, 8, 2)]
+    cages = [([i, i + 1], int(solution[i]) + int(solution[i + 1])) for i in starts]
+    killer = Sudoku({}, grid=SudokuGrid(3, cages=cages))
+    assert killer.infer_exact_cover()
+    assert is_valid_solution(killer)
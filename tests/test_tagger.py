@@ -0,0 +1,194 @@
+############################################################
+# Imports
+############################################################
+import math
+import random
+
+import pytest
+
+from POS_Tagging_Markov import Tagger, TaggerCounts, count_corpus_shards, sentence_words
+
+
+############################################################
+# Section 1: Synthetic corpus
+############################################################
+
+# a random HMM over ten of the tagger's twelve tags (no PRT, no X). each tag emits words of its own and
+# words from a pool every tag shares, so emissions alone cannot tell the tags apart and the transitions
+# have to. training and held-out sentences are drawn from the same HMM.
+CORPUS_TAGS = ("NOUN", "VERB", "ADJ", "ADV", "PRON", "DET", "ADP", "NUM", "CONJ")
+
+class HMM(object):
+
+    def __init__(self, seed, own_words=30, shared_words=20, shared_share=0.5):
+        rng = random.Random(seed)
+        self.following = dict((tag, [rng.random() ** 3 for _ in CORPUS_TAGS]) for tag in CORPUS_TAGS)
+        shared = ["w%d" % k for k in range(shared_words)]
+        self.emissions = {}
+        for tag in CORPUS_TAGS:
+            own = ["%s%d" % (tag.lower(), k) for k in range(own_words)]
+            pool = rng.sample(shared, shared_words // 2)
+            weights = [(1 - shared_share) / (k + 1) for k in range(own_words)] + [shared_share / len(pool)] * len(pool)
+            self.emissions[tag] = (own + pool, weights)
+
+    def sentences(self, count, seed):
+        rng = random.Random(seed)
+        sentences = []
+        for _ in range(count):
+            tag = rng.choice(CORPUS_TAGS)
+            sentence = []
+            for _ in range(rng.randint(3, 15)):
+                words, weights = self.emissions[tag]
+                sentence.append((rng.choices(words, weights)[0], tag))
+                tag = rng.choices(CORPUS_TAGS, self.following[tag])[0]
+            sentence.append((".", "."))
+            sentences.append(sentence)
+        return sentences
+
+def accuracy(tagger_function, sentences):
+    correct = total = 0
+    for sentence in sentences:
+        guesses = tagger_function(sentence_words(sentence))
+        correct += sum(guess == tag for guess, (word, tag) in zip(guesses, sentence))
+        total += len(sentence)
+    return correct / float(total)
+
+@pytest.fixture(scope="module")
+def hmm():
+    return HMM(seed=1)
+
+@pytest.fixture(scope="module")
+def tagger(hmm):
+    return Tagger(hmm.sentences(1500, seed=2))
+
+@pytest.fixture(scope="module")
+def held_out(hmm):
+    return hmm.sentences(150, seed=3)
+
+
+def write_corpus(path, sentences):
+    with open(path, "w") as file:
+        for sentence in sentences:
+            file.write(" ".join("%s=%s" % pair for pair in sentence) + "\n")
+    return str(path)
+
+
+############################################################
+# Section 2: Training
+############################################################
+
+def counts_of(counts):
+    return (counts.sentences, dict(counts.sum_of_Tags), dict(counts.ini_pi), dict(counts.tran_a),
+            dict(counts.emiss_b), dict(counts.tri_a))
+
+def test_sharded_counts_equal_serial_counts(hmm, tmp_path):
+    first = hmm.sentences(300, seed=4)
+    second = hmm.sentences(120, seed=5)
+    paths = [write_corpus(tmp_path / "first.txt", first), write_corpus(tmp_path / "second.txt", second)]
+    serial = counts_of(TaggerCounts().update(first + second))
+    # shard boundaries fall inside lines; every line must still be counted exactly once
+    for workers, shards_per_file in ((1, 1), (1, 7), (2, 5), (2, None)):
+        assert counts_of(count_corpus_shards(paths, workers, shards_per_file)) == serial
+    assert counts_of(count_corpus_shards(paths[0], 2, 3)) == counts_of(TaggerCounts().update(first))
+
+def test_trained_from_shards_equals_trained_in_memory(hmm, tmp_path):
+    sentences = hmm.sentences(300, seed=4)
+    path = write_corpus(tmp_path / "corpus.txt", sentences)
+    expected, sharded = Tagger(sentences), Tagger.from_corpus(path, workers=2, shards_per_file=4)
+    for name in ("log_pi", "log_a", "log_b", "log_a3"):
+        assert (getattr(sharded, name) == getattr(expected, name)).all()
+    assert sharded.words == expected.words and sharded.word_tags == expected.word_tags
+    assert sharded.lambdas == expected.lambdas
+
+
+############################################################
+# Section 3: Decoding
+############################################################
+
+def reference_viterbi(tagger, words):
+    # textbook Viterbi over the compiled tables, one tag pair at a time
+    n = len(tagger.tags)
+    columns = tagger.word_columns(words)
+    scores = [tagger.log_pi[i] + tagger.log_b[i, columns[0]] for i in range(n)]
+    back = []
+    for t in range(1, len(words)):
+        pointers, new_scores = [], []
+        for j in range(n):
+            best = max(range(n), key=lambda i: scores[i] + tagger.log_a[i, j])
+            pointers.append(best)
+            new_scores.append(scores[best] + tagger.log_a[best, j] + tagger.log_b[j, columns[t]])
+        back.append(pointers)
+        scores = new_scores
+    state = max(range(n), key=lambda i: scores[i])
+    path = [state]
+    for pointers in reversed(back):
+        state = pointers[state]
+        path.append(state)
+    return [tagger.tags[i] for i in reversed(path)]
+
+def test_viterbi_matches_the_reference_decoder(tagger, held_out):
+    for sentence in held_out[:60]:
+        words = sentence_words(sentence)
+        assert tagger.viterbi_tags(words) == reference_viterbi(tagger, words)
+
+def test_batched_and_streamed_decoding_match_one_sentence_at_a_time(tagger, held_out):
+    # mixed lengths, empty sentences (first, last and in between), unknown words and bare word lists
+    sentences = [[]] + held_out[:40] + [[], [("never-seen", "NOUN")], ["w1"], []] + held_out[40:80] + [[]]
+    expected = [tagger.viterbi_tags(sentence_words(sentence)) for sentence in sentences]
+    assert tagger.viterbi_tags_batch(sentences) == expected
+    assert list(tagger.viterbi_tags_stream(iter(sentences), batch_size=7)) == expected
+    assert tagger.viterbi_tags_batch([]) == [] and tagger.viterbi_tags_batch([[], []]) == [[], []]
+
+def test_tags_missing_from_training_are_never_guessed(tagger, held_out):
+    for sentence in held_out:
+        tags = tagger.viterbi_tags(sentence_words(sentence))
+        assert "PRT" not in tags and "X" not in tags
+    assert all(math.isinf(value) for value in tagger.log_b[tagger.tag_index["PRT"]])
+
+def test_most_probable_tags_match_a_scan_of_the_emissions(tagger, held_out):
+    # the original per-token scan of emiss_b, with the most frequent training tag for unknown words
+    def scan(word):
+        candidates = dict((key, p) for key, p in tagger.emiss_b.items() if key[1] == word and key[0] in tagger.tag_index)
+        if not candidates:
+            return max(tagger.tag_counts, key=tagger.tag_counts.get)
+        return max(candidates, key=candidates.get)[0]
+    words = sorted(set(word for sentence in held_out[:50] for word in sentence_words(sentence)))
+    words += ["never-seen", ""]
+    assert tagger.most_probable_tags(words) == [scan(word) for word in words]
+    assert tagger.most_probable_tags([]) == []
+
+def test_transitions_beat_emissions_alone(tagger, held_out):
+    per_word = accuracy(tagger.most_probable_tags, held_out)
+    assert per_word < 0.95  # shared words make the tags ambiguous
+    assert accuracy(tagger.viterbi_tags, held_out) > per_word + 0.02
+
+def test_exhaustive_trigram_search_is_no_worse_than_beam_one(tagger, held_out):
+    rows = dict((row["beam"], row["accuracy"]) for row in tagger.beam_tradeoff(held_out, beams=(1, None)))
+    assert rows[None] >= rows[1]
+    assert rows[None] >= rows["bigram"] - 0.02
+
+@pytest.mark.parametrize("beam", [0, -1])
+def test_beam_must_be_positive(tagger, beam):
+    with pytest.raises(ValueError):
+        tagger.viterbi_tags_trigram(["noun1", "verb2"], beam=beam)
+
+
+############################################################
+# Section 4: Saved models
+############################################################
+
+def test_save_load_round_trip(tagger, held_out, tmp_path):
+    path = str(tmp_path / "tagger.model")
+    tagger.save(path)
+    loaded = Tagger.load(path)
+    for sentence in held_out:
+        words = sentence_words(sentence) + ["never-seen"]
+        assert loaded.viterbi_tags(words) == tagger.viterbi_tags(words)
+        assert loaded.most_probable_tags(words) == tagger.most_probable_tags(words)
+        assert loaded.viterbi_tags_trigram(words) == tagger.viterbi_tags_trigram(words)
+
+def test_load_rejects_other_files(tmp_path):
+    path = str(tmp_path / "corpus.txt")
+    write_corpus(path, [[("a", "NOUN"), (".", ".")]])
+    with pytest.raises(ValueError):
+        Tagger.load(path)
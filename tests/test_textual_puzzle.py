@@ -0,0 +1,259 @@
+############################################################
+# Imports
+############################################################
+import copy
+from itertools import product
+import pickle
+import random
+
+import pytest
+
+from textualPuzzle import And, Atom, Iff, Implies, KnowledgeBase, Not, Or, Solver, count_clauses, count_models, \
+    satisfying_assignments
+
+
+############################################################
+# Section 1: Brute force
+############################################################
+
+# every randomized check below compares against trying all assignments, so the sizes stay small
+
+def random_clauses(rng, atoms, count, width=3):
+    return [[rng.choice((-1, 1)) * rng.randint(1, atoms) for _ in range(rng.randint(1, width))]
+            for _ in range(count)]
+
+def brute_satisfiable(clauses, atoms, assumptions=()):
+    for values in product((False, True), repeat=atoms):
+        holds = lambda literal: values[abs(literal) - 1] == (literal > 0)
+        if all(holds(literal) for literal in assumptions) and \
+                all(any(holds(literal) for literal in clause) for clause in clauses):
+            return True
+    return False
+
+def random_expr(rng, names, depth):
+    if depth == 0 or rng.random() < 0.25:
+        return Atom(rng.choice(names))
+    kind = rng.randrange(5)
+    if kind == 0:
+        return Not(random_expr(rng, names, depth - 1))
+    if kind in (1, 2):
+        parts = [random_expr(rng, names, depth - 1) for _ in range(rng.randint(1, 3))]
+        return And(*parts) if kind == 1 else Or(*parts)
+    left, right = random_expr(rng, names, depth - 1), random_expr(rng, names, depth - 1)
+    return Implies(left, right) if kind == 3 else Iff(left, right)
+
+def assignments(names):
+    for values in product((False, True), repeat=len(names)):
+        yield dict(zip(names, values))
+
+
+############################################################
+# Section 2: Solver
+############################################################
+
+@pytest.mark.parametrize("seed", range(40))
+def test_solver_agrees_with_brute_force(seed):
+    rng = random.Random(seed)
+    atoms = rng.randint(3, 10)
+    clauses = random_clauses(rng, atoms, rng.randint(1, 5 * atoms))
+    solver = Solver()
+    for clause in clauses:
+        solver.add_clause(clause)
+    for _ in range(5):
+        assumptions = [rng.choice((-1, 1)) * rng.randint(1, atoms) for _ in range(rng.randint(0, 3))]
+        satisfiable = solver.solve(assumptions)
+        assert satisfiable == brute_satisfiable(clauses, atoms, assumptions)
+        if satisfiable:
+            model = solver.model
+            assert all(model[abs(literal)] == (literal > 0) for literal in assumptions)
+            assert all(any(model[abs(literal)] == (literal > 0) for literal in clause) for clause in clauses)
+
+
+############################################################
+# Section 3: Knowledge base
+############################################################
+
+@pytest.mark.parametrize("tseitin", [False, True])
+@pytest.mark.parametrize("seed", range(15))
+def test_ask_agrees_with_brute_force(seed, tseitin):
+    rng = random.Random(seed)
+    names = ["a", "b", "c", "d", "e"]
+    facts = [random_expr(rng, names, 2) for _ in range(rng.randint(1, 4))]
+    kb = KnowledgeBase(tseitin=tseitin)
+    for fact in facts:
+        kb.tell(fact)
+    models = [assignment for assignment in assignments(names) if all(fact.evaluate(assignment) for fact in facts)]
+    for _ in range(10):
+        goal = random_expr(rng, names, 2)
+        assert kb.ask(goal) == all(goal.evaluate(assignment) for assignment in models)
+
+@pytest.mark.parametrize("tseitin", [False, True])
+def test_asking_changes_neither_the_facts_nor_cached_answers(tseitin):
+    a, b, c = Atom("a"), Atom("b"), Atom("c")
+    kb = KnowledgeBase(tseitin=tseitin)
+    kb.tell(Or(a, b))
+    kb.tell(Implies(a, c))
+    facts, version = kb.get_facts(), kb.version
+    first, second = Iff(a, Or(b, c)), And(Or(a, c), Not(b))
+    assert [kb.ask(first), kb.ask(second), kb.ask(first), kb.ask(second)] == [False] * 4
+    assert kb.searches == 2
+    assert kb.get_facts() == facts and kb.version == version
+    kb.tell(Not(b))
+    assert kb.ask(second)  # a new fact, so the cached answer is not used
+
+def test_facts_over_a_queried_subexpression_keep_its_definition():
+    # the Tseitin literal of And(a, b) is defined by the query and then used by a fact; the facts alone
+    # must still say what it means
+    a, b, c = Atom("a"), Atom("b"), Atom("c")
+    kb = KnowledgeBase(tseitin=True)
+    assert not kb.ask(Or(And(a, b), c))
+    kb.tell(Or(And(a, b), c))
+    kb.tell(Not(c))
+    assert kb.ask(a)
+    copy_kb = KnowledgeBase()
+    for fact in kb.get_facts():
+        copy_kb.tell(fact)
+    assert copy_kb.ask(a) and copy_kb.ask(b) and not copy_kb.ask(c)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_clause_bound_is_an_upper_bound(seed):
+    rng = random.Random(seed)
+    kb = KnowledgeBase()
+    for _ in range(20):
+        expr = random_expr(rng, ["a", "b", "c", "d"], 3)
+        for positive in (True, False):
+            bound = kb.atoms.clause_bound(expr, positive)
+            assert len(kb.atoms.clauses(expr, positive)) <= bound
+
+def test_large_goals_are_not_expanded_to_cnf():
+    goal = Atom("x0")
+    for k in range(1, 17):
+        goal = Iff(goal, Atom("x%d" % k))
+    exact, tseitin = KnowledgeBase(), KnowledgeBase(tseitin=True)
+    for kb in (exact, tseitin):
+        kb.tell(And(*[Atom("x%d" % k) for k in range(1, 17)]))
+    assert exact.atoms.clause_bound(goal) > exact.SUBSUME_LIMIT
+    # with x1 .. x16 true the chain is just x0
+    assert not exact.ask(goal) and not tseitin.ask(goal)
+    assert exact.ask(Iff(goal, Atom("x0"))) and tseitin.ask(Iff(goal, Atom("x0")))
+    assert (goal, True) not in exact.atoms._clauses
+
+
+############################################################
+# Section 4: Interned expressions
+############################################################
+
+def test_equal_expressions_are_one_object():
+    assert Atom("a") is Atom("a")
+    assert Or(Atom("a"), Not(Atom("b"))) is Or(Atom("a"), Not(Atom("b")))
+    assert Or(Atom("a"), Atom("b")) is Or(Atom("b"), Atom("a"))  # the operands of Or and And are a set
+    assert len(set([Implies(Atom("a"), Atom("b")) for _ in range(10)])) == 1
+
+def test_copies_and_pickles_are_the_interned_expression():
+    expr = And(Atom("a"), Not(Atom("b")), Iff(Atom("a"), Atom("c")))
+    assert copy.copy(expr) is expr
+    assert copy.deepcopy(expr) is expr
+    assert copy.deepcopy([expr, expr])[0] is expr
+    assert pickle.loads(pickle.dumps(expr)) is expr
+    assert repr(And()) == "And()"
+    kb = KnowledgeBase()
+    kb.tell(And())
+    assert kb.get_facts() == set()
+
+
+############################################################
+# Section 5: Models
+############################################################
+
+# the larger counts are checked against references that do not search: a sweep along banded clauses, and
+# enumerating the models of clauses that have few
+
+def random_3cnf(rng, atoms, count):
+    return [[rng.choice((-1, 1)) * atom for atom in rng.sample(range(1, atoms + 1), 3)] for _ in range(count)]
+
+def banded_clauses(rng, atoms, count, window):
+    # clauses over window consecutive atoms: quick to count by cutting the band into pieces, exponential by
+    # branching on atoms anywhere along it
+    clauses = []
+    for _ in range(count):
+        start = rng.randint(1, atoms - window + 1)
+        clauses.append([rng.choice((-1, 1)) * atom for atom in rng.sample(range(start, start + window), 3)])
+    return clauses
+
+def sweep_count(clauses, atoms, window):
+    # counts by assigning atoms 1, 2, ... in turn, keeping the number of ways to reach each assignment of
+    # the last window - 1 atoms; a clause is checked once its last atom is assigned
+    ending = {}
+    for clause in clauses:
+        ending.setdefault(max(abs(literal) for literal in clause), []).append(clause)
+    ways = {(): 1}
+    for atom in range(1, atoms + 1):
+        reached = {}
+        for values, count in ways.items():
+            for value in (False, True):
+                extended = values + (value,)
+                first = atom - len(extended) + 1
+                if all(any(extended[abs(literal) - first] == (literal > 0) for literal in clause)
+                       for clause in ending.get(atom, ())):
+                    key = extended[-(window - 1):]
+                    reached[key] = reached.get(key, 0) + count
+        ways = reached
+    return sum(ways.values())
+
+def enumerate_count(clauses, atoms):
+    solver = Solver()
+    for clause in clauses:
+        solver.add_clause(clause)
+    count = 0
+    while solver.solve():
+        count += 1
+        solver.add_clause([-atom if solver.model[atom] else atom for atom in range(1, atoms + 1)])
+    return count
+
+@pytest.mark.parametrize("seed", range(30))
+def test_models_agree_with_brute_force(seed):
+    rng = random.Random(seed)
+    expr = random_expr(rng, ["a", "b", "c", "d"], 3)
+    names = sorted(expr.atom_names())
+    expected = [assignment for assignment in assignments(names) if expr.evaluate(assignment)]
+    assert count_models(expr) == len(expected)
+    found = list(satisfying_assignments(expr))
+    assert sorted(sorted(model.items()) for model in found) == sorted(sorted(model.items()) for model in expected)
+    covered = 0
+    for cube in satisfying_assignments(expr, cubes=True):
+        free = [name for name in names if name not in cube]
+        for values in product((False, True), repeat=len(free)):
+            assignment = dict(cube, **dict(zip(free, values)))
+            assert expr.evaluate(assignment)
+            covered += 1
+    assert covered == len(expected)
+
+@pytest.mark.parametrize("seed", range(30))
+def test_clause_counts_agree_with_brute_force(seed):
+    rng = random.Random(seed)
+    atoms = rng.randint(1, 9)
+    clauses = random_clauses(rng, atoms, rng.randint(0, 3 * atoms))
+    expected = sum(all(any(values[abs(literal) - 1] == (literal > 0) for literal in clause) for clause in clauses)
+                   for values in product((False, True), repeat=atoms))
+    assert count_clauses(clauses, range(1, atoms + 1)) == expected
+
+@pytest.mark.parametrize("seed", range(3))
+def test_counts_banded_clauses(seed):
+    rng = random.Random(seed)
+    clauses = banded_clauses(rng, 200, 300, 8)
+    assert count_clauses(clauses, range(1, 201)) == sweep_count(clauses, 200, 8)
+
+@pytest.mark.parametrize("seed", [0, 2])  # the seeds whose clauses have models
+def test_counts_random_clauses_near_the_threshold(seed):
+    clauses = random_3cnf(random.Random(seed), 100, 430)
+    count = count_clauses(clauses, range(1, 101))
+    assert count > 0
+    assert count == enumerate_count(clauses, 100)
+
+def test_counts_split_on_an_atom():
+    clauses = random_3cnf(random.Random(0), 40, 60)
+    count = count_clauses(clauses, range(1, 41))
+    assert count > 2 ** 20
+    for atom in (1, 20, 40):
+        assert count == count_clauses(clauses + [[atom]], range(1, 41)) + \
+            count_clauses(clauses + [[-atom]], range(1, 41))